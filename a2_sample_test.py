@@ -4,7 +4,9 @@
 Department of Computer Science,
 University of Toronto
 """
+import json
 import os
+import pygame
 import pytest
 from hypothesis import given
 from hypothesis.strategies import integers
@@ -12,7 +14,19 @@ from typing import Tuple
 from tm_trees import DIRECTORYTREE_EXAMPLE_RESULT, FileTree, TMTree, \
     DirectoryTree, dir_tree_from_nested_tuple, path_to_nested_tuple, \
     ChessTree, get_worksheet_tree, moves_to_nested_dict, \
-    OperationNotSupportedError
+    OperationNotSupportedError, lazy_dir_tree_from_path, \
+    chess_tree_from_games, chess_tree_from_file, url_from_fen, \
+    url_from_moves, DirectoryTreeBuilder
+import tm_chess
+import tm_stats
+import tm_trees
+import treemap_visualiser
+from tm_chess import read_games
+from tm_benchmark_suite import find_slowdowns, load_baseline, save_baseline
+from tm_layout import SQUARIFIED
+from tm_render import PNG, SVG, render_batch
+from tm_scan import ScanCache, directory_sizes
+from tm_snapshot import load_snapshot, save_snapshot
 
 # This should be the path to the "workshop" directory in the sample data
 # included in the zip file for this assignment.
@@ -115,6 +129,20 @@ class TestTMTree:
         assert d1.is_displayed_tree_leaf() is True
         assert d2.is_displayed_tree_leaf() is False
 
+    def test_expand_all_last_expanded(self) -> None:
+        """
+        Test that expand_all returns the rightmost subtree of the last tree
+        it expanded, even when a leaf follows that tree.
+        """
+        a1 = TMTree('a1', [], 5)
+        a = TMTree('A', [a1], 1)
+        b = TMTree('B', [], 5)
+        root = TMTree('R', [a, b], 1)
+        a._expanded = False
+        root._expanded = False
+        assert root.expand_all() is a1
+        assert a._expanded and root._expanded
+
     def test_collapse_doctest(self) -> None:
         d1 = TMTree('C1', [], 5)
         d2 = TMTree('C2', [d1], 1)
@@ -159,6 +187,27 @@ class TestTMTree:
         assert t3.data_size == 11
         assert s2.rect == (0, 100, 100, 100)
 
+    def test_move_updates_all_ancestors(self) -> None:
+        worksheet_tree = get_worksheet_tree()
+        b, c, d = worksheet_tree._subtrees
+        j = b._subtrees[0]._subtrees[0]
+        j.move(d)
+        assert b.data_size == 20
+        assert b._subtrees[0].data_size == 10
+        assert d.data_size == 20
+        assert worksheet_tree.data_size == 60
+        assert d._expanded and j.is_displayed_tree_leaf()
+        assert j.rect == (35, 0, 20, 30)
+
+    def test_change_size_updates_all_ancestors(self) -> None:
+        worksheet_tree = get_worksheet_tree()
+        j = worksheet_tree._subtrees[0]._subtrees[0]._subtrees[0]
+        j.change_size(0.5)
+        assert j.data_size == 15
+        assert worksheet_tree._subtrees[0]._subtrees[0].data_size == 25
+        assert worksheet_tree._subtrees[0].data_size == 35
+        assert worksheet_tree.data_size == 65
+
     def test_get_path_string_doctest(self) -> None:
         d1 = TMTree('C1', [], 5)
         d2 = TMTree('C2', [d1], 1)
@@ -181,6 +230,286 @@ class TestTMTree:
                                (45, 0, 10, 30)]
         assert shape_only == expected_rectangles
 
+    def test_get_tree_at_position_edges(self) -> None:
+        """
+        Test that every position in the worksheet tree, including the shared
+        edges, is mapped to the first displayed leaf that contains it.
+        """
+        worksheet_tree = get_worksheet_tree()
+        worksheet_tree._subtrees[1]._expanded = False
+        worksheet_tree.update_rectangles((0, 0, 55, 30))
+        leaves = [worksheet_tree._subtrees[0]._subtrees[0]._subtrees[0],
+                  worksheet_tree._subtrees[0]._subtrees[0]._subtrees[1],
+                  worksheet_tree._subtrees[0]._subtrees[1],
+                  worksheet_tree._subtrees[1],
+                  worksheet_tree._subtrees[2]]
+        for x in range(-1, 57):
+            for y in range(-1, 32):
+                expected = None
+                for leaf in leaves:
+                    lx, ly, width, height = leaf.rect
+                    if lx <= x <= lx + width and ly <= y <= ly + height:
+                        expected = leaf
+                        break
+                assert worksheet_tree.get_tree_at_position((x, y)) is expected
+
+    def test_incremental_update_rectangles(self) -> None:
+        """
+        Test that laying out a tree again only lays out the parts of it
+        that changed.
+        """
+        worksheet_tree = get_worksheet_tree()
+        b, c, d = worksheet_tree._subtrees
+        g = c._subtrees[0]
+        assert not worksheet_tree._dirty
+        old_rect = g.rect
+        worksheet_tree.update_rectangles((0, 0, 55, 30))
+        assert g.rect is old_rect
+
+        e = b._subtrees[0]
+        e.collapse()
+        b.expand()
+        assert b._dirty and worksheet_tree._dirty and not c._dirty
+        worksheet_tree.update_rectangles((0, 0, 55, 30))
+        assert g.rect is old_rect
+        assert not b._dirty and not worksheet_tree._dirty
+
+        worksheet_tree.update_rectangles((0, 0, 110, 60))
+        assert g.rect == (60, 0, 30, 24)
+
+    def test_squarified_rectangles(self, monkeypatch) -> None:
+        """
+        Test that the squarified layout tiles the worksheet tree exactly, in
+        the natural order of its leaves.
+        """
+        monkeypatch.setattr(TMTree, 'layout_algorithm', SQUARIFIED)
+        worksheet_tree = get_worksheet_tree()
+        rects = [rect for rect, _ in worksheet_tree.get_rectangles()]
+        assert len(rects) == 7
+        assert sum(r[2] * r[3] for r in rects) == 55 * 30
+        for x, y, width, height in rects:
+            assert 0 <= x and x + width <= 55
+            assert 0 <= y and y + height <= 30
+        d = worksheet_tree._subtrees[2]
+        assert d.rect == (30, 18, 25, 12)
+        assert worksheet_tree.get_tree_at_position((50, 25)) is d
+
+    def test_min_rect_size(self, monkeypatch) -> None:
+        """
+        Test that a tree smaller than min_rect_size is displayed as a single
+        rectangle until it is large enough to show its subtrees.
+        """
+        monkeypatch.setattr(TMTree, 'min_rect_size', 16)
+        worksheet_tree = get_worksheet_tree()
+        c = worksheet_tree._subtrees[1]
+        assert c.rect == (30, 0, 15, 30)
+        rects = worksheet_tree.get_rectangles()
+        assert len(rects) == 5
+        assert (c.rect, c._colour) in rects
+        assert worksheet_tree.get_tree_at_position((35, 5)) is c
+
+        worksheet_tree.update_rectangles((0, 0, 110, 60))
+        assert len(worksheet_tree.get_rectangles()) == 7
+        g = c._subtrees[0]
+        assert g.rect == (60, 0, 30, 24)
+        assert worksheet_tree.get_tree_at_position((65, 5)) is g
+
+    def test_expand_culled_tree(self, monkeypatch) -> None:
+        """
+        Test that expanding a tree smaller than min_rect_size, or a tree with
+        such a descendant, returns a tree that was laid out.
+        """
+        monkeypatch.setattr(TMTree, 'min_rect_size', 200)
+        tree = dir_tree_from_nested_tuple(path_to_nested_tuple(EXAMPLE_PATH))
+        tree.update_rectangles((0, 0, 100, 100))
+        assert tree.expand() is tree
+        assert tree.expand_all() is tree
+
+        monkeypatch.setattr(TMTree, 'min_rect_size', 40)
+        tree = dir_tree_from_nested_tuple(path_to_nested_tuple(EXAMPLE_PATH))
+        tree.update_rectangles((0, 0, 200, 100))
+        activities, _, prep = tree._subtrees
+        assert prep.rect == (167, 0, 33, 100)
+        assert prep._subtrees[0].rect is None
+        assert prep.expand() is prep
+        assert tree.expand_all() is prep
+        assert activities.expand() is activities._subtrees[0]
+
+    def test_deep_tree_iterators(self) -> None:
+        """
+        Test that the tree iterators, and the methods that use them, work on
+        a tree much deeper than Python's recursion limit.
+        """
+        leaf = TMTree('leaf', [], 1)
+        root = leaf
+        for i in range(10000):
+            root = TMTree(f'dir{i}', [root], 1)
+        assert root.expand_all() is leaf
+        assert list(root.iter_displayed_leaves()) == [leaf]
+        assert len(list(root.iter_descendants())) == 10000
+        assert len(root.get_rectangles()) == 1
+        assert leaf.collapse() is leaf._parent_tree
+        assert root._subtrees[0].collapse() is root
+        assert list(root.iter_displayed_leaves()) == [root]
+
+    def test_deep_tree_construction(self) -> None:
+        """
+        Test that trees much deeper than Python's recursion limit can be
+        built, laid out and converted to strings.
+        """
+        obj = ('file.txt', 1)
+        for i in range(2000):
+            obj = (f'dir{i}', [obj])
+        tree = dir_tree_from_nested_tuple(obj)
+        tree.update_rectangles((0, 0, 100, 100))
+        leaf = tree.expand_all()
+        assert leaf.rect == (0, 0, 100, 100)
+        assert leaf._get_root() is tree
+        assert str(tree).count('\n') == 2000
+        assert leaf.get_path_string().count(os.path.sep) == 2000
+
+        chess_tree = ChessTree(moves_to_nested_dict([['e2e4'] * 2000]))
+        chess_tree.update_rectangles((0, 0, 100, 100))
+        assert chess_tree.data_size == 1
+        assert str(chess_tree).count('\n') == 2000
+
+    def test_compact_nodes(self) -> None:
+        """
+        Test that trees store their attributes in slots and share their
+        names and colours.
+        """
+        trees = [TMTree(''.join(['e2', 'e4']), [], 1) for _ in range(2)]
+        trees.append(FileTree('f', [], 1))
+        trees.append(ChessTree({('e2e4', 1): {}}))
+        for tree in trees:
+            assert not hasattr(tree, '__dict__')
+            assert is_valid_colour(tree._colour)
+        assert trees[0]._name is trees[1]._name
+
+    def test_array_tree_rectangles(self) -> None:
+        """
+        Test that the NumPy layout backend matches update_rectangles on the
+        worksheet tree, with and without a collapsed subtree.
+        """
+        tm_arrays = pytest.importorskip('tm_arrays')
+        worksheet_tree = get_worksheet_tree()
+        arrays = tm_arrays.ArrayTree(worksheet_tree)
+        arrays.update_rectangles((0, 0, 55, 30))
+        assert arrays.get_rectangles() == worksheet_tree.get_rectangles()
+
+        worksheet_tree._subtrees[0]._subtrees[0].collapse()
+        arrays.sync()
+        arrays.update_rectangles((0, 0, 55, 30))
+        worksheet_tree.update_rectangles((0, 0, 55, 30))
+        assert arrays.get_rectangles() == worksheet_tree.get_rectangles()
+        assert len(arrays.get_rectangles()) == 5
+
+    def test_array_layout(self) -> None:
+        """
+        Test that an ArrayLayout draws and hit-tests the worksheet tree like
+        the tree itself, and follows moves and size changes.
+        """
+        tm_arrays = pytest.importorskip('tm_arrays')
+        worksheet_tree = get_worksheet_tree()
+        layout = tm_arrays.ArrayLayout(worksheet_tree)
+        layout.update_rectangles((0, 0, 55, 30))
+        worksheet_tree.update_rectangles((0, 0, 55, 30))
+        assert list(layout.iter_rectangles()) == \
+            worksheet_tree.get_rectangles()
+        for pos in [(0, 0), (10, 10), (54, 29), (30, 5)]:
+            assert layout.get_tree_at_position(pos) is \
+                worksheet_tree.get_tree_at_position(pos)
+        assert layout.get_tree_at_position((100, 100)) is None
+
+        leaves = list(worksheet_tree.iter_displayed_leaves())
+        leaves[0].move(leaves[-1])
+        leaves[1].change_size(0.5)
+        layout.update_rectangles((0, 0, 55, 30))
+        worksheet_tree.update_rectangles((0, 0, 55, 30))
+        assert list(layout.iter_rectangles()) == \
+            worksheet_tree.get_rectangles()
+
+        # collapsing marks nothing dirty, but the layout notices it
+        parent = list(worksheet_tree.iter_displayed_leaves())[1].collapse()
+        assert not layout.is_laid_out((0, 0, 55, 30))
+        layout.update_rectangles((0, 0, 55, 30))
+        assert layout.is_laid_out((0, 0, 55, 30))
+        assert list(layout.iter_rectangles()) == \
+            list(worksheet_tree.iter_rectangles())
+
+        # the trees written back are marked as laid out
+        parent.expand()
+        assert parent._dirty and worksheet_tree._dirty
+        layout.update_rectangles((0, 0, 55, 30))
+        assert not parent._dirty and not worksheet_tree._dirty
+        assert list(layout.iter_rectangles()) == \
+            worksheet_tree.get_rectangles()
+
+    def test_phase_stats(self, tmp_path) -> None:
+        worksheet_tree = get_worksheet_tree()
+        tm_stats.enable(profile=True)
+        try:
+            worksheet_tree.update_rectangles((1, 0, 55, 30))
+            assert worksheet_tree.get_tree_at_position((1, 0)).data_size == 10
+            rectangles = worksheet_tree.get_rectangles()
+            frame = tm_stats.take_frame()
+            tm_stats.dump(str(tmp_path))
+        finally:
+            tm_stats.disable()
+        assert frame['update_rectangles'].counts == {'nodes': 11}
+        assert frame['get_tree_at_position'].counts == {'nodes': 3}
+        assert frame['get_rectangles'].counts == {'rects': len(rectangles)}
+        assert (tmp_path / 'update_rectangles.prof').exists()
+        with open(tmp_path / 'summary.txt') as file:
+            assert 'get_rectangles' in file.read()
+
+    def test_hud_toggle_stats(self, monkeypatch) -> None:
+        """
+        Test that the event loop only records stats while the HUD is shown,
+        unless they were already being recorded when it started.
+        """
+        hud_key = pygame.event.Event(pygame.KEYUP,
+                                     key=treemap_visualiser.HUD_KEY)
+        recorded = []
+
+        def wait(_: int) -> list[pygame.event.Event]:
+            recorded.append(tm_stats.enabled)
+            return batches.pop(0)
+        monkeypatch.setattr(treemap_visualiser, '_wait_for_events', wait)
+        monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+        pygame.init()
+        try:
+            screen = pygame.display.set_mode((800, 600))
+            tree = get_worksheet_tree()
+            tree.update_rectangles(
+                treemap_visualiser.get_screen_rect(screen, 1))
+            batches = [[hud_key], [hud_key], [pygame.event.Event(pygame.QUIT)]]
+            treemap_visualiser.event_loop(screen, tree, 1)
+            assert recorded == [False, True, False]
+            assert not tm_stats.enabled
+
+            tm_stats.enable()
+            recorded.clear()
+            batches = [[hud_key], [hud_key], [pygame.event.Event(pygame.QUIT)]]
+            treemap_visualiser.event_loop(screen, tree, 1, hud=True)
+            assert recorded == [True, True, True]
+        finally:
+            tm_stats.disable()
+            pygame.quit()
+            # the cached font and text do not outlive pygame.quit
+            treemap_visualiser._text_surfaces.cache_clear()
+            treemap_visualiser._get_font.cache_clear()
+
+    def test_benchmark_baseline(self, tmp_path) -> None:
+        path = str(tmp_path / 'baseline.json')
+        assert load_baseline(path) == {}
+        save_baseline({'a': 1.0, 'b': 2.0}, path)
+        save_baseline({'b': 1.0}, path)
+        baseline = load_baseline(path)
+        assert baseline == {'a': 1.0, 'b': 1.0}
+        assert find_slowdowns({'a': 1.2, 'b': 2.0}, baseline, 0.25) == \
+               {'b': 1.0}
+
 
 ###########################################
 # _FileTree and DirectoryTree provided basic testing
@@ -236,6 +565,63 @@ class TestFileSystem:
         assert rslt[0] == 'prep'
         assert rslt[1] == [('images', [('Cats.pdf', 17)]), ('reading.md', 7)]
 
+    def test_path_to_nested_tuple_workers(self) -> None:
+        """
+        Test that the scan result does not depend on the number of threads.
+        """
+        serial = path_to_nested_tuple(EXAMPLE_PATH, max_workers=1)
+        assert path_to_nested_tuple(EXAMPLE_PATH, max_workers=8) == serial
+        assert serial[0] == 'workshop'
+        assert [t[0] for t in serial[1]] == ['activities', 'draft.pptx', 'prep']
+
+    def test_path_to_nested_tuple_symlink_loop(self, tmp_path) -> None:
+        """
+        Test that a link back to an ancestor directory is not followed, with
+        or without threads, and in a background scan.
+        """
+        (tmp_path / 'sub').mkdir()
+        os.symlink(tmp_path, tmp_path / 'sub' / 'loop')
+        for workers in (1, 4):
+            name, contents = path_to_nested_tuple(str(tmp_path),
+                                                  max_workers=workers)
+            assert contents[0][0] == 'sub'
+            assert [t[0] for t in contents[0][1]] == ['loop']
+            assert not isinstance(contents[0][1][0][1], list)
+
+        builder = DirectoryTreeBuilder(str(tmp_path), max_workers=4)
+        builder._scan.wait()
+        while not builder.is_done():
+            builder.update()
+        assert builder.tree._subtrees[0]._subtrees[0]._name == 'loop'
+
+    def test_scan_cache(self, tmp_path) -> None:
+        """
+        Test that a saved ScanCache only lists directories that changed, and
+        still produces the same result as a full scan.
+        """
+        root = str(tmp_path / 'root')
+        os.makedirs(os.path.join(root, 'a', 'b'))
+        os.makedirs(os.path.join(root, 'c'))
+        with open(os.path.join(root, 'a', 'b', 'f.txt'), 'w') as f:
+            f.write('hello')
+        db = str(tmp_path / 'scan.db')
+
+        cache = ScanCache(db)
+        assert cache.scan_nested_tuple(root) == path_to_nested_tuple(root)
+        cache.save()
+
+        cache = ScanCache(db)
+        with open(os.path.join(root, 'c', 'g.txt'), 'w') as f:
+            f.write('hi')
+        os.remove(os.path.join(root, 'a', 'b', 'f.txt'))
+        os.rmdir(os.path.join(root, 'a', 'b'))
+        assert cache.scan_nested_tuple(root) == path_to_nested_tuple(root)
+        assert cache._changed == {os.path.join(root, 'a'),
+                                  os.path.join(root, 'c')}
+        assert cache._removed == {os.path.join(root, 'a', 'b')}
+        cache.save()
+        assert ScanCache(db).directory_sizes(root) == directory_sizes(root)
+
     def test_example_data(self) -> None:
         """
         Test that the root of the tree at the 'workshop' directory is correct.
@@ -252,6 +638,58 @@ class TestFileSystem:
             # This checks ids rather than values.
             assert subtree._parent_tree is tree
 
+    def test_lazy_directory_tree(self) -> None:
+        """
+        Test that a lazily read tree matches the fully read tree once it has
+        been expanded, whether its sizes are exact or estimated.
+        """
+        nested_tuple = path_to_nested_tuple(EXAMPLE_PATH)
+        expected = str(dir_tree_from_nested_tuple(nested_tuple))
+
+        exact = lazy_dir_tree_from_path(EXAMPLE_PATH,
+                                        directory_sizes(EXAMPLE_PATH))
+        assert exact.data_size == 162
+        assert all(t._subtrees == [] for t in exact._subtrees)
+        exact.expand_all()
+        assert str(exact) == expected
+
+        estimated = lazy_dir_tree_from_path(EXAMPLE_PATH)
+        activities = estimated._subtrees[0]
+        assert activities._subtrees == []
+        activities.expand()
+        assert activities._subtrees[0]._parent_tree is activities
+        estimated.expand_all()
+        assert estimated.data_size == 162
+        assert str(estimated) == expected
+
+    def test_expand_lazy_tree_then_hover(self, monkeypatch) -> None:
+        """
+        Test that the event loop lays out the subtrees read by expanding a
+        lazy tree before it looks up the hovered node among them.
+        """
+        tree = lazy_dir_tree_from_path('example-directory')
+        pos = (400, 300)
+        batches = [[pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                       button=pygame.BUTTON_LEFT, pos=pos)],
+                   [pygame.event.Event(pygame.KEYUP, key=pygame.K_e),
+                    pygame.event.Event(pygame.MOUSEMOTION, pos=pos)],
+                   [pygame.event.Event(pygame.QUIT)]]
+        monkeypatch.setattr(treemap_visualiser, '_wait_for_events',
+                            lambda timeout: batches.pop(0))
+        monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+        pygame.init()
+        try:
+            screen = pygame.display.set_mode((800, 600))
+            tree.update_rectangles(
+                treemap_visualiser.get_screen_rect(screen, 1))
+            treemap_visualiser.event_loop(screen, tree, 1)
+        finally:
+            pygame.quit()
+        workshop = tree._subtrees[0]
+        assert workshop._expanded
+        assert all(t.rect is not None for t in workshop._subtrees)
+        assert tree.get_tree_at_position(pos) in workshop._subtrees
+
     @given(integers(min_value=100, max_value=1000),
            integers(min_value=100, max_value=1000),
            integers(min_value=100, max_value=1000),
@@ -294,6 +732,121 @@ class TestFileSystem:
         for i in range(len(actual_rects)):
             assert actual_rects[i] == expected_rects[i]
 
+    def test_snapshot(self, tmp_path) -> None:
+        """
+        Test that a snapshot loads the same tree that was saved, creating
+        subtrees only as they are expanded, and that other files are
+        rejected.
+        """
+        path = str(tmp_path / 'example.tms')
+        tree = lazy_dir_tree_from_path(EXAMPLE_PATH)
+        save_snapshot(tree, path)
+        loaded = load_snapshot(path)
+        assert isinstance(loaded, DirectoryTree)
+        assert loaded.data_size == tree.data_size
+        assert loaded._subtrees == []
+        loaded.expand_all()
+        tree.expand_all()
+        assert str(loaded) == str(tree)
+        assert [t._colour for t in loaded.iter_descendants()] == \
+               [t._colour for t in tree.iter_descendants()]
+
+        # only the root was expanded when the snapshot was saved
+        restored = load_snapshot(path, restore_expanded=True)
+        assert restored._expanded
+        assert [t._name for t in restored._subtrees] == \
+               [t._name for t in tree._subtrees]
+        assert not any(t._expanded for t in restored._subtrees)
+
+        with open(path, 'wb') as file:
+            file.write(b'not a snapshot')
+        with pytest.raises(ValueError):
+            load_snapshot(path)
+
+    def test_snapshot_change_size(self, tmp_path) -> None:
+        """
+        Test that shrinking a tree loaded from a snapshot before its subtrees
+        have been created leaves it at least as large as its subtrees.
+        """
+        path = str(tmp_path / 'tree.tms')
+        a = TMTree('A', [TMTree('a1', [], 50), TMTree('a2', [], 50)], 1)
+        save_snapshot(TMTree('R', [a], 1), path)
+        loaded = load_snapshot(path)
+        loaded.update_rectangles((0, 0, 100, 100))
+        assert loaded._subtrees == []
+        loaded.change_size(-0.9)
+        assert [t._name for t in loaded._subtrees] == ['A']
+        assert loaded.data_size == 101
+
+    def test_render_batch(self, tmp_path) -> None:
+        """
+        Test that render_batch writes a treemap of each directory, and that
+        the SVG has the rectangles of the tree.
+        """
+        roots = [EXAMPLE_PATH, os.path.join(EXAMPLE_PATH, 'activities')]
+        paths = render_batch(roots, str(tmp_path), (200, 100), SVG, 2)
+        assert [os.path.basename(p) for p in paths] == \
+               ['0_workshop.svg', '1_activities.svg']
+
+        with open(paths[0]) as file:
+            svg = file.read()
+        tree = dir_tree_from_nested_tuple(path_to_nested_tuple(EXAMPLE_PATH))
+        tree.update_rectangles((0, 0, 200, 100))
+        assert svg.count('<rect ') == len(tree.get_rectangles()) == 6
+        assert '<rect x="94" y="0" width="73" height="100"' in svg
+
+        paths = render_batch(roots[:1], str(tmp_path), (200, 100), PNG, 1)
+        assert pygame.image.load(paths[0]).get_size() == (200, 100)
+
+    def test_directory_tree_builder(self, tmp_path) -> None:
+        """
+        Test that a DirectoryTreeBuilder grows its tree one listing at a time,
+        keeping every data_size consistent, and ends with the same tree as a
+        full scan, or raises the error that stopped the scan.
+        """
+        builder = DirectoryTreeBuilder(EXAMPLE_PATH, max_workers=1)
+        tree = builder.tree
+        assert tree._subtrees == []
+        assert tree.data_size == 1
+        builder._scan.wait()
+
+        assert builder.update(1)
+        assert [t._name for t in tree._subtrees] == \
+               ['activities', 'draft.pptx', 'prep']
+        assert tree._expanded
+        # the directories that have not been listed yet are empty
+        assert tree.data_size == 1 + sum(t.data_size for t in tree._subtrees)
+        assert tree._subtrees[0].data_size == 1
+        tree.update_rectangles((0, 0, 200, 100))
+        assert len(tree.get_rectangles()) == 3
+
+        while not builder.is_done():
+            builder.update(1)
+            for t in tree.iter_descendants():
+                if t._subtrees:
+                    assert t.data_size == \
+                           1 + sum(s.data_size for s in t._subtrees)
+        assert not builder.update()
+
+        expected = dir_tree_from_nested_tuple(
+            path_to_nested_tuple(EXAMPLE_PATH))
+        for t in (tree, expected):
+            t.expand_all()
+            t.update_rectangles((0, 0, 200, 100))
+        assert str(tree) == str(expected)
+
+        # a broken link can't be sized, which stops the scan
+        (tmp_path / 'sub').mkdir()
+        os.symlink(tmp_path / 'missing', tmp_path / 'sub' / 'link')
+        builder = DirectoryTreeBuilder(str(tmp_path), max_workers=1)
+        builder._scan.wait()
+        assert builder.update()
+        assert not builder.is_done()
+        with pytest.raises(FileNotFoundError):
+            builder.update()
+        assert builder.is_done()
+        assert [t._name for t in builder.tree._subtrees] == ['sub']
+
 
 ###########################################
 # ChessTree provided basic testing
@@ -323,6 +876,171 @@ class TestChessTree:
                           "    e2e4 | (1) None\n" \
                           "        e7e5(1) None"
 
+    def test_chess_tree_from_games(self) -> None:
+        """
+        Test that building a ChessTree directly from the games gives the
+        same tree as building it from the nested dictionary.
+        """
+        games = [['e2e4', 'e7e5', 'g1f3'], ['e2e4', 'e7e5'], ['d2d4'], [],
+                 ['e2e4', 'c7c5']]
+        expected = ChessTree(moves_to_nested_dict(games))
+        actual = chess_tree_from_games(iter(games))
+        assert str(actual) == str(expected)
+        assert [type(t) for t in actual._get_children()] == \
+            [type(t) for t in expected._get_children()]
+
+    def test_parallel_chess_tree(self, tmp_path) -> None:
+        """
+        Test that building the trie of moves of a file in several processes
+        gives the same ChessTree as building it in one, and that pruning it
+        gives the complete trie pruned.
+        """
+        with open('wgm_200.json') as file:
+            games = json.load(file)
+        path = tmp_path / 'games.txt'
+        path.write_text('\n'.join(' '.join(game) for game in games) + '\n')
+        expected = chess_tree_from_games(games, max_depth=8)
+        for workers in (1, 3):
+            actual = chess_tree_from_file(str(path), max_depth=8,
+                                          max_workers=workers)
+            assert str(actual) == str(expected)
+        trie = tm_chess.build_move_trie(games, None, 8)
+        tm_chess.prune_move_trie(trie, 2)
+        assert repr(tm_chess.build_move_trie_from_file(str(path), 3, 8, 2)) \
+            == repr(trie)
+
+    def test_read_shard_games(self, tmp_path) -> None:
+        """
+        Test that the shards of a file with one game per line hold every
+        game once, in order, wherever the file is split.
+        """
+        path = tmp_path / 'games.txt'
+        path.write_bytes(b'e2e4 e7e5\n\nd2d4\r\nc2c4 c7c5 g1f3\nb2b3')
+        games = list(read_games(str(path)))
+        size = path.stat().st_size
+        for first in range(size + 1):
+            for second in range(first, size + 1):
+                bounds = [0, first, second, size]
+                shards = [tm_chess.read_shard_games(str(path), start, end)
+                          for start, end in zip(bounds, bounds[1:])]
+                assert [game for shard in shards for game in shard] == games
+
+    def test_pruned_view(self) -> None:
+        """
+        Test that pruned views of a ChessTree keep the sizes of the trees
+        that are kept, and do not change the original tree.
+        """
+        with open('wgm_200.json') as file:
+            tree = chess_tree_from_games(json.load(file))
+        full = str(tree)
+        view = tree.pruned_view(max_depth=4, min_games=3)
+        assert str(tree) == full
+        assert view.data_size == tree.data_size
+        assert len(view._get_children()) < len(tree._get_children())
+        originals = {t._name: t for t in tree._subtrees}
+        for subtree in view._subtrees:
+            if subtree._name != 'other':
+                assert subtree.data_size == originals[subtree._name].data_size
+                assert subtree.data_size >= 3
+        depth = 0
+        leaf = view.expand_all()
+        while leaf._parent_tree is not None:
+            leaf = leaf._parent_tree
+            depth += 1
+        assert depth <= 5
+
+    def test_pruned_view_of_subtree(self) -> None:
+        """
+        Test that the trees in a pruned view of a tree that is not a root
+        have the same moves and board positions as the trees they copy.
+        """
+        pytest.importorskip('chess')
+        with open('wgm_10.json') as file:
+            tree = chess_tree_from_games(json.load(file))
+        e4 = tree._subtrees[0]
+        view = e4.pruned_view(min_games=2)
+        assert view.get_moves() == e4.get_moves()
+        assert view.get_fen() == e4.get_fen()
+        originals = {t._name: t for t in e4._subtrees}
+        for subtree in view._subtrees:
+            if isinstance(subtree, ChessTree):
+                original = originals[subtree._name]
+                assert subtree.get_moves() == original.get_moves()
+                assert subtree.get_fen() == original.get_fen()
+        for subtree in view.iter_descendants():
+            if isinstance(subtree, ChessTree):
+                moves = subtree.get_moves()
+                assert moves[0] == 'e2e4'
+                assert url_from_fen(subtree.get_fen()) == \
+                    url_from_moves(moves)
+
+    def test_chess_fen(self, monkeypatch) -> None:
+        """
+        Test that the remembered board positions of a ChessTree match the
+        positions reached by replaying the moves, and that only
+        FEN_CACHE_SIZE of them are remembered, by the root of each tree.
+        """
+        pytest.importorskip('chess')
+        monkeypatch.setattr(tm_trees, 'FEN_CACHE_SIZE', 50)
+        with open('wgm_10.json') as file:
+            tree = chess_tree_from_games(json.load(file))
+        for subtree in tree.iter_descendants():
+            if isinstance(subtree, ChessTree):
+                moves = subtree.get_moves()
+                assert url_from_fen(subtree.get_fen()) == \
+                    url_from_moves(moves)
+                assert subtree.get_path_string().startswith(
+                    ' | '.join(['-'] + moves))
+        assert len(tree._fen_cache) <= 50
+        other = chess_tree_from_games([['e2e4']])
+        tm_trees.chess_fen(other._subtrees[0])
+        assert len(other._fen_cache) == 1
+
+    def test_chess_snapshot(self, tmp_path) -> None:
+        """
+        Test that a ChessTree loaded from a snapshot has the same moves,
+        positions and pruned views as the tree that was saved.
+        """
+        pytest.importorskip('chess')
+        path = str(tmp_path / 'wgm_10.tms')
+        with open('wgm_10.json') as file:
+            tree = chess_tree_from_games(json.load(file))
+        save_snapshot(tree, path)
+        loaded = load_snapshot(path)
+        assert isinstance(loaded, ChessTree)
+        first = loaded.expand()
+        assert first.get_suffix() == ' (black to play)'
+        assert first.get_fen() == tree._subtrees[0].get_fen()
+        assert loaded.expand_all().get_path_string() == \
+               tree.expand_all().get_path_string()
+        assert str(loaded.pruned_view(min_games=2)) == \
+               str(tree.pruned_view(min_games=2))
+
+    def test_read_games(self, tmp_path) -> None:
+        """
+        Test that games are read the same way from a JSON array and from a
+        file with one game per line, and that pruning while they are read
+        keeps the total number of games.
+        """
+        games = [['e2e4', 'e7e5', 'g1f3'], ['e2e4', 'e7e5'], ['d2d4'],
+                 ['e2e4', 'c7c5']]
+        json_path = tmp_path / 'games.json'
+        json_path.write_text(json.dumps(games, indent=1))
+        line_path = tmp_path / 'games.txt'
+        line_path.write_text('\n'.join(' '.join(game) for game in games))
+        assert list(read_games(str(json_path))) == games
+        assert list(read_games(str(line_path))) == games
+
+        tree = chess_tree_from_games(read_games(str(json_path)), max_depth=2,
+                                     min_games=2)
+        assert tree.data_size == 4
+        assert str(tree) == "- | (4) None\n" \
+                            "    e2e4 | (3) None\n" \
+                            "        e7e5 | (2) None\n" \
+                            "            other(1) None\n" \
+                            "        other(1) None\n" \
+                            "    other(1) None"
+
 
 if __name__ == '__main__':
     pytest.main(['a2_sample_test.py'])
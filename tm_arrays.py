@@ -0,0 +1,468 @@
+"""Assignment 2: Array-Encoded Treemap Layout
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module contains an optional, NumPy based backend for the treemap
+layout. A TMTree is flattened into contiguous arrays in breadth-first order,
+so the subtrees of every tree are next to each other and every depth of the
+tree is a contiguous range of indices. The slice-and-dice layout is then
+computed one depth at a time with prefix sums, instead of one tree at a time.
+
+The results can be drawn straight from the arrays, or written back to the
+rect attribute of the trees. An ArrayLayout lays out, draws and hit-tests a
+tree this way through the same methods as a TMTree, so that the visualiser
+can display it in place of the tree (see
+treemap_visualiser.run_visualisation).
+
+This module requires NumPy, which the rest of the program does not.
+"""
+from __future__ import annotations
+from typing import Iterator, Optional
+
+import numpy as np
+
+import tm_stats
+from tm_layout import SLICE_AND_DICE
+from tm_trees import TMTree
+
+
+class ArrayTree:
+    """
+    A TMTree flattened into arrays, indexed by the position of each tree in
+    a breadth-first traversal of the tree (so the root has index 0).
+
+    === Public Attributes ===
+    nodes:
+        The trees of the flattened tree, in breadth-first order.
+    parent:
+        The index of the parent of each tree, or -1 for the root.
+    first_child:
+        The index of the first subtree of each tree. The subtrees of a tree
+        are the child_count indices starting at first_child.
+    child_count:
+        The number of subtrees of each tree.
+    data_size:
+        The data_size of each tree.
+    rects:
+        The (x, y, width, height) rectangle of each tree, as an (n, 4) array.
+    colours:
+        The RGB colour of each tree, as an (n, 3) array.
+    expanded:
+        Whether each tree is expanded.
+    levels:
+        The (start, end) range of indices of the trees at each depth.
+
+    === Private Attributes ===
+    _preorder:
+        The position of each tree in a preorder traversal of the tree, which
+        is the order that TMTree.get_rectangles uses.
+    _laid_out:
+        Whether each tree was given a rectangle by the last layout.
+    _culled:
+        Whether each tree was found to be smaller than min_rect_size by the
+        last layout, so that it is displayed as a single rectangle.
+    _classes:
+        The classes of the trees in nodes.
+
+    === Representation Invariants ===
+    - All arrays have one entry per tree in nodes.
+    """
+    nodes: list[TMTree]
+    parent: np.ndarray
+    first_child: np.ndarray
+    child_count: np.ndarray
+    data_size: np.ndarray
+    rects: np.ndarray
+    colours: np.ndarray
+    expanded: np.ndarray
+    levels: list[tuple[int, int]]
+    _preorder: np.ndarray
+    _laid_out: np.ndarray
+    _culled: np.ndarray
+    _classes: set[type]
+
+    def __init__(self, tree: TMTree) -> None:
+        """Initialize a new ArrayTree by flattening <tree>.
+
+        >>> s1 = TMTree('C1', [], 5)
+        >>> s2 = TMTree('C2', [], 15)
+        >>> arrays = ArrayTree(TMTree('C', [s1, s2], 1))
+        >>> arrays.parent.tolist(), arrays.data_size.tolist()
+        ([-1, 0, 0], [21, 5, 15])
+        """
+        nodes = [tree]
+        parent = [-1]
+        first_child = []
+        depth = [0]
+        levels = []
+        level_start = 0
+        i = 0
+        while i < len(nodes):
+            if depth[i] != depth[level_start]:
+                levels.append((level_start, i))
+                level_start = i
+            first_child.append(len(nodes))
+            for subtree in nodes[i]._subtrees:
+                nodes.append(subtree)
+                parent.append(i)
+                depth.append(depth[i] + 1)
+            i += 1
+        levels.append((level_start, len(nodes)))
+
+        n = len(nodes)
+        self.nodes = nodes
+        self.levels = levels
+        self._classes = set(map(type, nodes))
+        self.parent = np.array(parent, dtype=np.int64)
+        self.first_child = np.array(first_child, dtype=np.int64)
+        self.child_count = np.array([len(t._subtrees) for t in nodes],
+                                    dtype=np.int64)
+        self.colours = np.array([t._colour for t in nodes],
+                                dtype=np.uint8).reshape(n, 3)
+        self.rects = np.zeros((n, 4), dtype=np.int64)
+        self._laid_out = np.zeros(n, dtype=bool)
+        self._culled = np.zeros(n, dtype=bool)
+        self.data_size = np.zeros(n, dtype=np.int64)
+        self.expanded = np.zeros(n, dtype=bool)
+        self.sync()
+
+        preorder = np.empty(n, dtype=np.int64)
+        stack = [0]
+        rank = 0
+        while stack:
+            curr = stack.pop()
+            preorder[curr] = rank
+            rank += 1
+            start = first_child[curr]
+            stack.extend(range(start + len(nodes[curr]._subtrees) - 1,
+                               start - 1, -1))
+        self._preorder = preorder
+
+    def sync(self) -> bool:
+        """Copy the data_size and _expanded attributes of every tree in nodes
+        into the arrays, e.g. after the trees have been expanded or resized,
+        and return whether any of them changed.
+
+        The shape of the tree must not have changed since it was flattened
+        (see has_shape_of).
+        """
+        data_size = np.array([t.data_size for t in self.nodes],
+                             dtype=np.int64)
+        expanded = np.array([t._expanded for t in self.nodes], dtype=bool)
+        changed = not (np.array_equal(data_size, self.data_size)
+                       and np.array_equal(expanded, self.expanded))
+        self.data_size[:] = data_size
+        self.expanded[:] = expanded
+        return changed
+
+    def has_shape_of(self, tree: TMTree) -> bool:
+        """Return whether <tree> still has the shape it had when it was
+        flattened into this ArrayTree, i.e. whether no tree has been moved,
+        and no subtrees have been added (e.g. loaded by a LazyDirectoryTree)
+        or removed since.
+
+        >>> s1 = TMTree('C1', [], 5)
+        >>> t1 = TMTree('C', [s1, TMTree('C2', [], 15)], 1)
+        >>> t1.update_rectangles((0, 0, 100, 200))
+        >>> arrays = ArrayTree(t1)
+        >>> arrays.has_shape_of(t1)
+        True
+        >>> s1.move(t1._subtrees[1])
+        >>> arrays.has_shape_of(t1)
+        False
+        """
+        nodes = self.nodes
+        if nodes[0] is not tree or [len(t._subtrees) for t in nodes] \
+                != self.child_count.tolist():
+            return False
+        parents = self.parent.tolist()
+        return all(nodes[i]._parent_tree is nodes[parents[i]]
+                   for i in range(1, len(nodes)))
+
+    def update_rectangles(self, rect: tuple[int, int, int, int]) -> None:
+        """Compute the slice-and-dice layout of the tree filling the pygame
+        rectangle <rect>, exactly as TMTree.update_rectangles would.
+
+        As with TMTree.update_rectangles, only trees that are reached from
+        the root without passing through a leaf of the displayed-tree are
+        given a new rectangle, and trees smaller than the min_rect_size of
+        the root are not divided between their subtrees.
+
+        Raise a ValueError if any of the trees is laid out with another
+        algorithm than slice-and-dice (see TMTree.layout_algorithm).
+
+        >>> s1 = TMTree('C1', [], 5)
+        >>> s2 = TMTree('C2', [], 15)
+        >>> arrays = ArrayTree(TMTree('C', [s1, s2], 1))
+        >>> arrays.update_rectangles((0, 0, 100, 200))
+        >>> arrays.rects.tolist()
+        [[0, 0, 100, 200], [0, 0, 100, 50], [0, 50, 100, 150]]
+        """
+        for cls in self._classes:
+            if cls.layout_algorithm != SLICE_AND_DICE:
+                raise ValueError(f"{cls.__name__} uses the "
+                                 f"{cls.layout_algorithm} layout, but only "
+                                 f"slice-and-dice can be computed with "
+                                 f"arrays")
+        n = len(self.nodes)
+        # the rectangle each tree was asked to fill, before data_size == 0
+        # trees are replaced by an empty rectangle
+        layout = np.zeros((n, 4), dtype=np.int64)
+        layout[0] = rect
+        laid_out = np.zeros(n, dtype=bool)
+        laid_out[0] = True
+        min_rect_size = self.nodes[0].min_rect_size
+        culled = np.zeros(n, dtype=bool)
+        culled[0] = self.data_size[0] != 0 \
+            and min(rect[2], rect[3]) < min_rect_size
+
+        # a tree's subtrees are laid out iff it is not a displayed-tree leaf
+        parent_expanded = np.ones(n, dtype=bool)
+        parent_expanded[1:] = self.expanded[self.parent[1:]]
+        recurse = self.expanded | ~parent_expanded
+
+        for start, end in self.levels[1:]:
+            par = self.parent[start:end]
+            active = laid_out[par] & recurse[par] & ~culled[par]
+            if not active.any():
+                continue
+            sizes = self.data_size[start:end]
+            # the sum of the sizes of each tree's subtrees
+            group_start = self.first_child[par] - start
+            starts, group = np.unique(group_start, return_inverse=True)
+            totals = np.add.reduceat(sizes, starts)[group]
+            x, y, width, height = layout[par].T
+            horizontal = width > height
+            along = np.where(horizontal, width, height)
+            lengths = np.rint(sizes / totals * along).astype(np.int64)
+            before = np.cumsum(lengths) - lengths
+            offsets = before - before[group_start]
+            is_last = np.arange(start, end) == (self.first_child[par]
+                                               + self.child_count[par] - 1)
+            lengths = np.where(is_last, along - offsets, lengths)
+
+            level = np.where(
+                horizontal[:, None],
+                np.stack([x + offsets, y, lengths, height], axis=1),
+                np.stack([x, y + offsets, width, lengths], axis=1))
+            layout[start:end][active] = level[active]
+            laid_out[start:end] = active
+            culled[start:end] = active & (self.data_size[start:end] != 0) \
+                & (layout[start:end, 2:].min(axis=1) < min_rect_size)
+
+        self.rects[laid_out] = np.where((self.data_size == 0)[:, None], 0,
+                                        layout)[laid_out]
+        self._laid_out = laid_out
+        self._culled = culled
+
+    def _displayed(self) -> np.ndarray:
+        """Return whether each tree is in the displayed-tree after the last
+        layout, i.e. whether all of its ancestors are expanded and were not
+        found to be smaller than min_rect_size.
+        """
+        displayed = np.zeros(len(self.nodes), dtype=bool)
+        displayed[0] = True
+        for start, end in self.levels[1:]:
+            par = self.parent[start:end]
+            displayed[start:end] = displayed[par] & self.expanded[par] \
+                & ~self._culled[par]
+        return displayed
+
+    def displayed_tree(self) -> np.ndarray:
+        """Return the indices of the trees in the displayed-tree after the
+        last layout, in no particular order.
+        """
+        return np.flatnonzero(self._displayed())
+
+    def displayed_leaves(self) -> np.ndarray:
+        """Return the indices of the leaves of the displayed-tree with a
+        non-zero data_size, in the order used by TMTree.get_rectangles.
+        """
+        leaves = self._displayed() & ((self.child_count == 0) | ~self.expanded
+                                      | self._culled) & (self.data_size != 0)
+        indices = np.flatnonzero(leaves)
+        return indices[np.argsort(self._preorder[indices])]
+
+    def tree_at_position(self, pos: tuple[int, int]) -> int:
+        """Return the index of the tree that TMTree.get_tree_at_position
+        would return for <pos> on the root, after the last layout, or -1 if
+        <pos> is outside the root's rectangle.
+
+        >>> s1 = TMTree('C1', [], 5)
+        >>> s2 = TMTree('C2', [], 15)
+        >>> arrays = ArrayTree(TMTree('C', [s1, s2], 1))
+        >>> arrays.update_rectangles((0, 0, 100, 200))
+        >>> arrays.tree_at_position((0, 50)), arrays.tree_at_position((0, 51))
+        (1, 2)
+        >>> arrays.tree_at_position((500, 500))
+        -1
+        """
+        x, y = pos
+        rects = self.rects
+        root = rects[0]
+        if not (root[0] <= x <= root[0] + root[2]
+                and root[1] <= y <= root[1] + root[3]):
+            return -1
+        curr = 0
+        while self.expanded[curr] and self.child_count[curr] \
+                and not self._culled[curr]:
+            start = int(self.first_child[curr])
+            sub = rects[start:start + self.child_count[curr]]
+            inside = (sub[:, 0] <= x) & (x <= sub[:, 0] + sub[:, 2]) \
+                & (sub[:, 1] <= y) & (y <= sub[:, 1] + sub[:, 3])
+            if not inside.any():
+                return 0
+            curr = start + int(inside.argmax())
+        return curr
+
+    def get_rectangles(self) -> list[tuple[tuple[int, int, int, int],
+                                           tuple[int, int, int]]]:
+        """Return the same list of (rect, colour) tuples as
+        TMTree.get_rectangles would for the root of the tree.
+
+        >>> s1 = TMTree('C1', [], 5)
+        >>> s2 = TMTree('C2', [], 15)
+        >>> arrays = ArrayTree(TMTree('C', [s1, s2], 1))
+        >>> arrays.update_rectangles((0, 0, 100, 200))
+        >>> [rect for rect, _ in arrays.get_rectangles()]
+        [(0, 0, 100, 50), (0, 50, 100, 150)]
+        """
+        leaves = self.displayed_leaves()
+        return list(zip(map(tuple, self.rects[leaves].tolist()),
+                        map(tuple, self.colours[leaves].tolist())))
+
+    def write_back(self, trees: Optional[np.ndarray] = None) -> None:
+        """Write the rectangles computed by the last layout back to the rect
+        attribute of the trees with the given indices, or of every tree that
+        was laid out if <trees> is None.
+
+        The trees are marked as laid out (see TMTree._dirty), so
+        TMTree.update_rectangles skips them while they do not change. This
+        assumes that the arrays were synced with the trees before the layout.
+        """
+        if trees is None:
+            trees = np.flatnonzero(self._laid_out)
+        for i, rect in zip(trees.tolist(), self.rects[trees].tolist()):
+            tree = self.nodes[i]
+            tree.rect = tuple(rect)
+            tree._dirty = False
+
+
+class ArrayLayout:
+    """
+    A TMTree laid out, drawn and hit-tested with an ArrayTree, through the
+    methods of TMTree that the visualiser uses (update_rectangles,
+    is_laid_out, iter_rectangles and get_tree_at_position), so that it can
+    be displayed in place of the tree.
+
+    Changes to the trees are noticed through TMTree.changes, so laying out
+    a tree that has not changed costs nothing. Otherwise, data_size and
+    _expanded are copied from the trees into the arrays, or the tree is
+    flattened again if its shape has changed, and the tree is laid out
+    again. Only the rectangles of the displayed-tree are written back to the
+    trees, which are marked as laid out, so that TMTree.update_rectangles
+    (e.g. after TMTree.move) only lays out the trees that changed since.
+
+    === Public Attributes ===
+    tree:
+        The root of the tree.
+    arrays:
+        The tree, flattened into arrays.
+
+    === Private Attributes ===
+    _rect:
+        The rectangle the tree was last laid out in, or None.
+    _changes:
+        The value of TMTree.changes when the tree was last laid out.
+    _leaves:
+        The indices of the leaves of the displayed-tree with a non-zero
+        data_size after the last layout, in the order they are drawn.
+
+    >>> s1 = TMTree('C1', [], 5)
+    >>> s2 = TMTree('C2', [], 15)
+    >>> layout = ArrayLayout(TMTree('C', [s1, s2], 1))
+    >>> layout.update_rectangles((0, 0, 100, 200))
+    >>> [rect for rect, _ in layout.iter_rectangles()]
+    [(0, 0, 100, 50), (0, 50, 100, 150)]
+    >>> layout.get_tree_at_position((100, 100)) is s2
+    True
+    >>> layout.is_laid_out((0, 0, 100, 200))
+    True
+    >>> s1.change_size(-0.5)
+    >>> layout.is_laid_out((0, 0, 100, 200))
+    False
+    >>> layout.update_rectangles((0, 0, 100, 200))
+    >>> [rect for rect, _ in layout.iter_rectangles()]
+    [(0, 0, 100, 24), (0, 24, 100, 176)]
+    """
+    tree: TMTree
+    arrays: ArrayTree
+    _rect: Optional[tuple[int, int, int, int]]
+    _changes: int
+    _leaves: np.ndarray
+
+    def __init__(self, tree: TMTree) -> None:
+        """Initialize a new ArrayLayout of <tree>, which has not been laid
+        out yet.
+        """
+        self.tree = tree
+        self.arrays = ArrayTree(tree)
+        self._rect = None
+        self._changes = TMTree.changes
+        self._leaves = np.zeros(0, dtype=np.int64)
+
+    def update_rectangles(self, rect: tuple[int, int, int, int]) -> None:
+        """Lay the tree out to fill the pygame rectangle <rect>, unless it
+        already does and has not changed since (see TMTree.update_rectangles).
+
+        Raise a ValueError if the tree is not laid out with slice-and-dice.
+        """
+        if self.is_laid_out(rect):
+            return
+        with tm_stats.phase('update_rectangles'):
+            changes = TMTree.changes
+            if not self.arrays.has_shape_of(self.tree):
+                self.arrays = ArrayTree(self.tree)
+            elif not self.arrays.sync() and self._rect == rect:
+                self._changes = changes
+                return
+            self.arrays.update_rectangles(rect)
+            self._leaves = self.arrays.displayed_leaves()
+            self.arrays.write_back(self.arrays.displayed_tree())
+            tm_stats.count('update_rectangles', 'nodes',
+                           len(self.arrays.nodes))
+        self._rect = rect
+        self._changes = changes
+
+    def is_laid_out(self, rect: tuple[int, int, int, int]) -> bool:
+        """Return whether the tree fills the pygame rectangle <rect> and no
+        tree has changed since it was last laid out.
+        """
+        return self._changes == TMTree.changes and self._rect == rect
+
+    def iter_rectangles(self) -> Iterator[tuple[tuple[int, int, int, int],
+                                                tuple[int, int, int]]]:
+        """Yield the same (rect, colour) tuples as TMTree.iter_rectangles,
+        straight from the arrays of the last layout.
+        """
+        rects = self.arrays.rects[self._leaves].tolist()
+        colours = self.arrays.colours[self._leaves].tolist()
+        return zip(map(tuple, rects), map(tuple, colours))
+
+    def get_tree_at_position(self, pos: tuple[int, int]) -> Optional[TMTree]:
+        """Return the tree that TMTree.get_tree_at_position would return for
+        <pos> after the last layout, or None if <pos> is outside the tree's
+        rectangle.
+        """
+        i = self.arrays.tree_at_position(pos)
+        if i < 0:
+            return None
+        return self.arrays.nodes[i]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
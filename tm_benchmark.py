@@ -0,0 +1,272 @@
+"""Assignment 2: Treemap Benchmarks
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module contains measurements of the memory used by the treemap trees,
+of the CPU used by the visualiser while it waits for input, and of the size
+of pruned chess trees, and a stress test of very deep trees. Run it directly
+to print the results.
+
+The time taken by each operation is measured by the benchmarks in
+tm_benchmark_suite instead, which can be compared with a baseline.
+"""
+from __future__ import annotations
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Iterator
+
+import pygame
+
+from tm_chess import read_games
+from tm_trees import TMTree, ChessTree, moves_to_nested_dict, \
+    get_worksheet_tree, dir_tree_from_nested_tuple, chess_tree_from_games
+from treemap_visualiser import event_loop, get_screen_rect, FONT_ROWS
+
+
+def bytes_per_node(build: Callable[[], TMTree]) -> float:
+    """
+    Return the average number of bytes allocated per tree in the TMTree
+    returned by <build>, as measured by tracemalloc.
+
+    >>> bytes_per_node(lambda: TMTree('a', [TMTree('b', [], 1)])) > 0
+    True
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tree = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / _count_nodes(tree)
+
+
+def _count_nodes(tree: TMTree) -> int:
+    """
+    Return the number of trees in <tree>, including <tree> itself.
+    """
+    count = 0
+    stack = [tree]
+    while stack:
+        curr = stack.pop()
+        count += 1
+        stack.extend(curr._subtrees)
+    return count
+
+
+def flat_tree(n: int) -> TMTree:
+    """
+    Return a TMTree whose root has <n> leaves, like a directory containing
+    <n> files.
+    """
+    return TMTree('root', [TMTree(f'file{i}.txt', [], i + 1)
+                           for i in range(n)])
+
+
+def chess_tree(path: str) -> ChessTree:
+    """
+    Return the ChessTree for the games in the JSON file at <path>.
+    """
+    with open(path) as file:
+        games = json.load(file)
+    return ChessTree(moves_to_nested_dict(games))
+
+
+def synthetic_games(n: int, path: str = 'wgm_999.json',
+                    seed: int = 0) -> Iterator[list[str]]:
+    """
+    Yield <n> games, each a random non-empty opening of one of the games in
+    the JSON file at <path>, so that the games share their openings the way
+    games in a large database do.
+    """
+    with open(path) as file:
+        games = [game for game in json.load(file) if game]
+    rng = random.Random(seed)
+    for _ in range(n):
+        game = rng.choice(games)
+        yield game[:rng.randint(1, len(game))]
+
+
+def report_chess_pruning() -> None:
+    """
+    Print the number of trees in the ChessTree for wgm_999.json, and in
+    views of it pruned by depth and by number of games.
+    """
+    tree = chess_tree('wgm_999.json')
+    print(f"wgm_999.json: {_count_nodes(tree)} trees")
+    for max_depth, min_games in [(None, 2), (None, 10), (10, 1), (10, 5)]:
+        view = tree.pruned_view(max_depth, min_games)
+        print(f"pruned_view({max_depth}, {min_games}): "
+              f"{_count_nodes(view)} trees")
+
+
+def peak_memory(function: Callable[[], Any]) -> int:
+    """
+    Return the peak number of bytes allocated while calling <function>, as
+    measured by tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def report_chess_ingestion(n: int = 200000) -> None:
+    """
+    Print the peak memory used to build the ChessTree for <n> synthetic games
+    stored in a JSON file, when the file is loaded all at once, when the
+    games are read one at a time, and when they are also pruned as they are
+    read.
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'games.json')
+    with open(path, 'w') as file:
+        json.dump(list(synthetic_games(n)), file)
+
+    def load_all() -> None:
+        with open(path) as f:
+            chess_tree_from_games(json.load(f))
+
+    builds = [('json.load', load_all),
+              ('read_games', lambda: chess_tree_from_games(read_games(path))),
+              ('read_games, max_depth=20, min_games=10',
+               lambda: chess_tree_from_games(read_games(path), 20, 10))]
+    for name, build in builds:
+        print(f"{n} games, {name}: {peak_memory(build) / 2 ** 20:.0f} MiB")
+    os.remove(path)
+
+
+def report_memory() -> None:
+    """
+    Print the number of bytes used per tree for a flat tree and for the
+    ChessTree of the largest chess data set.
+    """
+    print(f"flat tree (100000 leaves): "
+          f"{bytes_per_node(lambda: flat_tree(100000)):.0f} bytes/node")
+    print(f"ChessTree (wgm_999.json): "
+          f"{bytes_per_node(lambda: chess_tree('wgm_999.json')):.0f} "
+          f"bytes/node")
+
+
+def deep_chain_nested_tuple(depth: int) -> tuple[str, int | list]:
+    """
+    Return the nested tuple for a chain of <depth> directories, each containing
+    only the next one, with a single file at the bottom.
+
+    >>> deep_chain_nested_tuple(2)
+    ('dir0', [('dir1', [('file.txt', 1)])])
+    """
+    obj = ('file.txt', 1)
+    for i in range(depth - 1, -1, -1):
+        obj = (f'dir{i}', [obj])
+    return obj
+
+
+def stress_deep_trees(depth: int = 100000, str_depth: int = 5000) -> None:
+    """
+    Build, lay out, traverse and print trees that are <depth> trees deep, and
+    print how long each step takes. This only succeeds if none of these
+    steps recurse once per level of the tree, since the recursion limit is
+    not raised.
+
+    The string representation of a chain has a line per tree indented by its
+    depth, so its length is quadratic in the depth; it is built for a chain
+    that is only <str_depth> trees deep.
+    """
+    limit = sys.getrecursionlimit()
+    chain = deep_chain_nested_tuple(depth)
+    tree = _timed('dir_tree_from_nested_tuple',
+                  lambda: dir_tree_from_nested_tuple(chain))
+    _timed('update_rectangles', lambda: tree.update_rectangles((0, 0, 800,
+                                                                600)))
+    _timed('get_rectangles', tree.get_rectangles)
+    leaf = _timed('expand_all', tree.expand_all)
+    _timed('_get_root', leaf._get_root)
+    _timed('collapse_all', leaf.collapse_all)
+
+    game = [f'm{i}' for i in range(depth)]
+    chess = _timed('ChessTree',
+                   lambda: ChessTree(moves_to_nested_dict([game])))
+    _timed('ChessTree.update_rectangles',
+           lambda: chess.update_rectangles((0, 0, 800, 600)))
+
+    short_tree = dir_tree_from_nested_tuple(deep_chain_nested_tuple(str_depth))
+    _timed('str', lambda: str(short_tree))
+    assert sys.getrecursionlimit() == limit
+    print(f"depth {depth} (str: {str_depth}) with recursion limit {limit}")
+
+
+def _timed(name: str, function: Callable[[], Any]) -> Any:
+    """
+    Return the result of calling <function>, and print how long it took
+    labelled with <name>.
+    """
+    start = time.perf_counter()
+    result = function()
+    print(f"{name}: {time.perf_counter() - start:.3f} s")
+    return result
+
+
+def event_loop_cpu(seconds: float, motion: bool) -> float:
+    """
+    Return the fraction of one CPU used by the event loop of the visualiser
+    over <seconds> seconds, while the mouse is left still, or while it moves
+    continuously (one motion event per millisecond) if <motion> is True.
+
+    The display is pygame's dummy video driver, so no window is opened. The
+    CPU time of the thread that posts the motion events is included.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((800, 600))
+    tree = get_worksheet_tree()
+    tree.expand_all()
+    tree.update_rectangles(get_screen_rect(screen, FONT_ROWS))
+
+    def post_events() -> None:
+        end = time.monotonic() + seconds
+        i = 0
+        while motion and time.monotonic() < end:
+            i += 1
+            pygame.event.post(pygame.event.Event(
+                pygame.MOUSEMOTION, pos=(i % 800, i % 600), rel=(1, 1),
+                buttons=(0, 0, 0)))
+            time.sleep(0.001)
+        time.sleep(max(0.0, end - time.monotonic()))
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    poster = threading.Thread(target=post_events)
+    start_cpu, start = time.process_time(), time.perf_counter()
+    poster.start()
+    event_loop(screen, tree, FONT_ROWS)
+    poster.join()
+    used = (time.process_time() - start_cpu) / (time.perf_counter() - start)
+    pygame.display.quit()
+    return used
+
+
+def report_event_loop_cpu() -> None:
+    """
+    Print the CPU used by the event loop of the visualiser while idle and
+    under continuous mouse motion.
+    """
+    print(f"event loop, idle: {event_loop_cpu(2.0, False):.1%} CPU")
+    print(f"event loop, mouse motion: {event_loop_cpu(2.0, True):.1%} CPU")
+
+
+if __name__ == '__main__':
+    report_memory()
+    report_chess_ingestion()
+    report_chess_pruning()
+    report_event_loop_cpu()
+    stress_deep_trees()
@@ -0,0 +1,510 @@
+"""Assignment 2: Treemap Benchmark Suite
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module contains a suite of benchmarks of the main operations on
+treemaps: scanning a directory, building trees (in one process and in
+several), laying them out, getting their rectangles, finding the tree at a
+position, expanding and collapsing them, pruning them, finding the board
+positions of chess trees, saving and loading snapshots, and drawing them
+with the visualiser and with tm_render.
+
+The memory and CPU used by the trees and the visualiser are measured by
+tm_benchmark instead.
+
+The times are saved to a JSON baseline, and later runs are compared with it,
+so that changes that make an operation slower can be caught. Run this module
+to run the suite, e.g.:
+
+    python tm_benchmark_suite.py --save         # record a new baseline
+    python tm_benchmark_suite.py                # compare with the baseline
+    python tm_benchmark_suite.py --threshold 0.5 layout_chess render_chess
+
+It exits with status 1 if any benchmark is more than the threshold slower
+than the baseline (by default, 25% slower).
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+from itertools import cycle
+from typing import Any, Callable, Optional
+
+import pygame
+
+from tm_benchmark import synthetic_games
+from tm_render import PNG, SVG, render_batch
+from tm_snapshot import load_snapshot, save_snapshot
+from tm_trees import TMTree, ChessTree, moves_to_nested_dict, \
+    path_to_nested_tuple, dir_tree_from_nested_tuple, chess_tree_from_games, \
+    chess_tree_from_file, chess_fen, url_from_fen
+from treemap_visualiser import render_display, get_screen_rect, WIDTH, \
+    HEIGHT, FONT_ROWS
+
+# The file that the baseline is saved to by default.
+BASELINE_PATH = 'benchmark_baseline.json'
+
+# How much slower than the baseline a benchmark can be, as a fraction of the
+# time in the baseline, before it counts as a slowdown.
+DEFAULT_THRESHOLD = 0.25
+
+# How many times each benchmark is run. The fastest time is kept, since it
+# is the one least affected by other work done by the machine.
+DEFAULT_REPEAT = 5
+
+# The shape of the directory tree generated for the directory benchmarks:
+# how many levels of directories, how many directories in each directory,
+# and how many files (of FILE_SIZE bytes) in each directory.
+DIRECTORY_DEPTH = 3
+DIRECTORY_FANOUT = 6
+FILES_PER_DIRECTORY = 8
+FILE_SIZE = 100
+
+# The number of games in the synthetic chess benchmark.
+SYNTHETIC_GAMES = 100000
+
+# The number of processes used by the benchmarks of parallel operations.
+BENCHMARK_WORKERS = 4
+
+# The number of treemaps of the example directory drawn by the batch
+# rendering benchmarks.
+BATCH_RENDER_MAPS = 16
+
+# The treemaps are laid out in a rectangle of the size of the visualiser.
+TREEMAP_RECT = (0, 0, WIDTH, HEIGHT)
+
+# A benchmark: a function that takes the path of the generated directory
+# tree, does any work that should not be timed, and returns the function to
+# time. The directory tree is alone in a temporary directory, so benchmarks
+# can write their own files next to it.
+Benchmark = Callable[[str], Callable[[], Any]]
+
+
+def generate_directory(path: str, depth: int = DIRECTORY_DEPTH,
+                       fanout: int = DIRECTORY_FANOUT,
+                       files: int = FILES_PER_DIRECTORY,
+                       size: int = FILE_SIZE) -> None:
+    """
+    Generate a directory tree in the existing directory at <path>, with
+    <fanout> directories in each directory down to <depth> levels below
+    <path>, and <files> files of <size> bytes in every directory.
+    """
+    # (directory, depth of the directory) pairs that are still to be filled
+    stack = [(path, 0)]
+    while stack:
+        directory, level = stack.pop()
+        for i in range(files):
+            with open(os.path.join(directory, f'file{i}.txt'), 'wb') as file:
+                file.write(b'x' * size)
+        if level < depth:
+            for i in range(fanout):
+                subdirectory = os.path.join(directory, f'dir{i}')
+                os.mkdir(subdirectory)
+                stack.append((subdirectory, level + 1))
+
+
+def _load_games(path: str) -> list[list[str]]:
+    """
+    Return the games in the JSON file at <path>.
+    """
+    with open(path) as file:
+        return json.load(file)
+
+
+def _chess_tree() -> ChessTree:
+    """
+    Return the fully expanded ChessTree for wgm_999.json, laid out in
+    TREEMAP_RECT.
+    """
+    tree = ChessTree(moves_to_nested_dict(_load_games('wgm_999.json')))
+    tree.expand_all()
+    tree.update_rectangles(TREEMAP_RECT)
+    return tree
+
+
+def _directory_tree(directory: str) -> TMTree:
+    """
+    Return the fully expanded DirectoryTree of <directory>, laid out in
+    TREEMAP_RECT.
+    """
+    tree = dir_tree_from_nested_tuple(path_to_nested_tuple(directory))
+    tree.expand_all()
+    tree.update_rectangles(TREEMAP_RECT)
+    return tree
+
+
+def bench_scan_directory(directory: str) -> Callable[[], Any]:
+    """path_to_nested_tuple on the generated directory tree."""
+    return lambda: path_to_nested_tuple(directory)
+
+
+def bench_build_directory(directory: str) -> Callable[[], Any]:
+    """dir_tree_from_nested_tuple for the generated directory tree."""
+    nested = path_to_nested_tuple(directory)
+    return lambda: dir_tree_from_nested_tuple(nested)
+
+
+def _bench_build_chess(games: list[list[str]]) -> Callable[[], Any]:
+    """ChessTree(moves_to_nested_dict(<games>))."""
+    return lambda: ChessTree(moves_to_nested_dict(games))
+
+
+def bench_build_wgm_10(_: str) -> Callable[[], Any]:
+    """The ChessTree for wgm_10.json."""
+    return _bench_build_chess(_load_games('wgm_10.json'))
+
+
+def bench_build_wgm_200(_: str) -> Callable[[], Any]:
+    """The ChessTree for wgm_200.json."""
+    return _bench_build_chess(_load_games('wgm_200.json'))
+
+
+def bench_build_wgm_999(_: str) -> Callable[[], Any]:
+    """The ChessTree for wgm_999.json."""
+    return _bench_build_chess(_load_games('wgm_999.json'))
+
+
+def bench_build_synthetic(_: str) -> Callable[[], Any]:
+    """The ChessTree for SYNTHETIC_GAMES synthetic games."""
+    return _bench_build_chess(list(synthetic_games(SYNTHETIC_GAMES)))
+
+
+def bench_build_wgm_999_trie(_: str) -> Callable[[], Any]:
+    """chess_tree_from_games for wgm_999.json."""
+    games = _load_games('wgm_999.json')
+    return lambda: chess_tree_from_games(games)
+
+
+def bench_build_synthetic_trie(_: str) -> Callable[[], Any]:
+    """chess_tree_from_games for SYNTHETIC_GAMES synthetic games."""
+    games = list(synthetic_games(SYNTHETIC_GAMES))
+    return lambda: chess_tree_from_games(games)
+
+
+def _synthetic_games_file(directory: str) -> str:
+    """
+    Return the path of a file of SYNTHETIC_GAMES synthetic games, one per
+    line, next to the generated <directory>, writing it if it does not exist
+    yet.
+    """
+    path = os.path.join(os.path.dirname(directory), 'synthetic_games.txt')
+    if not os.path.exists(path):
+        with open(path, 'w') as file:
+            for game in synthetic_games(SYNTHETIC_GAMES):
+                file.write(' '.join(game) + '\n')
+    return path
+
+
+def _bench_build_file(directory: str, max_workers: int) -> Callable[[], Any]:
+    """
+    chess_tree_from_file for a file of SYNTHETIC_GAMES synthetic games (see
+    _synthetic_games_file), with <max_workers> processes. Comparing the times
+    for different numbers of processes shows how the build scales with the
+    number of cores.
+    """
+    path = _synthetic_games_file(directory)
+    return lambda: chess_tree_from_file(path, max_workers=max_workers)
+
+
+def bench_build_synthetic_file_1(directory: str) -> Callable[[], Any]:
+    """chess_tree_from_file with 1 process (see _bench_build_file)."""
+    return _bench_build_file(directory, 1)
+
+
+def bench_build_synthetic_file_2(directory: str) -> Callable[[], Any]:
+    """chess_tree_from_file with 2 processes (see _bench_build_file)."""
+    return _bench_build_file(directory, 2)
+
+
+def bench_build_synthetic_file_4(directory: str) -> Callable[[], Any]:
+    """chess_tree_from_file with 4 processes (see _bench_build_file)."""
+    return _bench_build_file(directory, 4)
+
+
+def _bench_layout(tree: TMTree) -> Callable[[], Any]:
+    """
+    update_rectangles on the whole of <tree>. The rectangle alternates
+    between two positions one pixel apart, so that every call moves the
+    rectangle of every tree, and lays all of them out again.
+    """
+    x, y, width, height = TREEMAP_RECT
+    rects = cycle([(x + 1, y, width, height), TREEMAP_RECT])
+    return lambda: tree.update_rectangles(next(rects))
+
+
+def bench_layout_chess(_: str) -> Callable[[], Any]:
+    """update_rectangles on the ChessTree for wgm_999.json."""
+    return _bench_layout(_chess_tree())
+
+
+def bench_layout_directory(directory: str) -> Callable[[], Any]:
+    """update_rectangles on the generated directory tree."""
+    return _bench_layout(_directory_tree(directory))
+
+
+def bench_rectangles_chess(_: str) -> Callable[[], Any]:
+    """get_rectangles on the ChessTree for wgm_999.json."""
+    return _chess_tree().get_rectangles
+
+
+def bench_hit_test_chess(_: str) -> Callable[[], Any]:
+    """
+    get_tree_at_position on the ChessTree for wgm_999.json, at every tenth
+    pixel.
+    """
+    tree = _chess_tree()
+    x, y, width, height = TREEMAP_RECT
+    positions = [(i, j) for i in range(x, x + width, 10)
+                 for j in range(y, y + height, 10)]
+    return lambda: [tree.get_tree_at_position(pos) for pos in positions]
+
+
+def bench_expand_collapse_chess(_: str) -> Callable[[], Any]:
+    """collapse_all then expand_all on the ChessTree for wgm_999.json."""
+    tree = _chess_tree()
+
+    def run() -> None:
+        tree.collapse_all()
+        tree.expand_all()
+    return run
+
+
+def bench_pruned_view_chess(_: str) -> Callable[[], Any]:
+    """
+    pruned_view(10, 5) of the ChessTree for wgm_999.json, i.e. the moves at
+    most 10 deep played in at least 5 games.
+    """
+    tree = _chess_tree()
+    return lambda: tree.pruned_view(10, 5)
+
+
+def bench_fen_chess(_: str) -> Callable[[], Any]:
+    """
+    The lichess url of the board position of every tree in the ChessTree for
+    wgm_200.json, starting with no positions remembered (see chess_fen).
+    """
+    tree = chess_tree_from_games(_load_games('wgm_200.json'))
+
+    def run() -> None:
+        tree._fen_cache = None
+        for t in tree.iter_descendants():
+            url_from_fen(chess_fen(t))
+    return run
+
+
+def bench_render_chess(_: str) -> Callable[[], Any]:
+    """
+    render_display of the ChessTree for wgm_999.json, on pygame's dummy
+    video driver so that no window is opened.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    tree = _chess_tree()
+    tree.update_rectangles(get_screen_rect(screen, FONT_ROWS))
+    return lambda: render_display(screen, tree)
+
+
+def _snapshot_path(directory: str) -> str:
+    """
+    Return the path of the snapshot file of the benchmarks, next to the
+    generated <directory>.
+    """
+    return os.path.join(os.path.dirname(directory), 'benchmark.tms')
+
+
+def bench_save_snapshot(directory: str) -> Callable[[], Any]:
+    """save_snapshot of the ChessTree for SYNTHETIC_GAMES synthetic games."""
+    tree = chess_tree_from_games(synthetic_games(SYNTHETIC_GAMES))
+    return lambda: save_snapshot(tree, _snapshot_path(directory))
+
+
+def bench_load_snapshot(directory: str) -> Callable[[], Any]:
+    """
+    load_snapshot of the ChessTree for SYNTHETIC_GAMES synthetic games, then
+    expanding its root and laying it out, which is what the visualiser does
+    before the tree is displayed.
+    """
+    path = _snapshot_path(directory)
+    save_snapshot(chess_tree_from_games(synthetic_games(SYNTHETIC_GAMES)),
+                  path)
+
+    def run() -> None:
+        tree = load_snapshot(path)
+        tree.expand()
+        tree.update_rectangles(TREEMAP_RECT)
+    return run
+
+
+def _bench_render_batch(directory: str, image_format: str) \
+        -> Callable[[], Any]:
+    """
+    render_batch of BATCH_RENDER_MAPS treemaps of the example directory in
+    <image_format>, with BENCHMARK_WORKERS processes, to a directory next to
+    the generated <directory>.
+    """
+    roots = [os.path.join('example-directory', 'workshop')] * BATCH_RENDER_MAPS
+    output_dir = os.path.join(os.path.dirname(directory), 'render')
+    os.makedirs(output_dir, exist_ok=True)
+    return lambda: render_batch(roots, output_dir, image_format=image_format,
+                                max_workers=BENCHMARK_WORKERS)
+
+
+def bench_render_batch_png(directory: str) -> Callable[[], Any]:
+    """render_batch to PNG files (see _bench_render_batch)."""
+    return _bench_render_batch(directory, PNG)
+
+
+def bench_render_batch_svg(directory: str) -> Callable[[], Any]:
+    """render_batch to SVG files (see _bench_render_batch)."""
+    return _bench_render_batch(directory, SVG)
+
+
+# The benchmarks of the suite, by name, in the order in which they are run.
+BENCHMARKS: dict[str, Benchmark] = {
+    'scan_directory': bench_scan_directory,
+    'build_directory': bench_build_directory,
+    'build_wgm_10': bench_build_wgm_10,
+    'build_wgm_200': bench_build_wgm_200,
+    'build_wgm_999': bench_build_wgm_999,
+    'build_synthetic': bench_build_synthetic,
+    'build_wgm_999_trie': bench_build_wgm_999_trie,
+    'build_synthetic_trie': bench_build_synthetic_trie,
+    'build_synthetic_file_1': bench_build_synthetic_file_1,
+    'build_synthetic_file_2': bench_build_synthetic_file_2,
+    'build_synthetic_file_4': bench_build_synthetic_file_4,
+    'layout_chess': bench_layout_chess,
+    'layout_directory': bench_layout_directory,
+    'rectangles_chess': bench_rectangles_chess,
+    'hit_test_chess': bench_hit_test_chess,
+    'expand_collapse_chess': bench_expand_collapse_chess,
+    'pruned_view_chess': bench_pruned_view_chess,
+    'fen_chess': bench_fen_chess,
+    'save_snapshot': bench_save_snapshot,
+    'load_snapshot': bench_load_snapshot,
+    'render_chess': bench_render_chess,
+    'render_batch_png': bench_render_batch_png,
+    'render_batch_svg': bench_render_batch_svg,
+}
+
+
+def measure(function: Callable[[], Any], repeat: int = DEFAULT_REPEAT) \
+        -> float:
+    """
+    Return the fastest of <repeat> times, in seconds, taken to call
+    <function>. As with the timeit module, garbage collection is turned off
+    while <function> runs.
+
+    >>> measure(lambda: None) < 0.01
+    True
+    """
+    return min(timeit.repeat(function, repeat=repeat, number=1))
+
+
+def run_suite(names: Optional[list[str]] = None,
+              repeat: int = DEFAULT_REPEAT) -> dict[str, float]:
+    """
+    Run the benchmarks in BENCHMARKS with the given <names> (or all of them,
+    if <names> is None), and return their times in seconds, by name.
+
+    Precondition: every name in <names> is a key of BENCHMARKS.
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = os.path.join(temp_dir, 'tree')
+        os.mkdir(directory)
+        generate_directory(directory)
+        for name in names:
+            results[name] = measure(BENCHMARKS[name](directory), repeat)
+    return results
+
+
+def find_slowdowns(results: dict[str, float], baseline: dict[str, float],
+                   threshold: float = DEFAULT_THRESHOLD) \
+        -> dict[str, float]:
+    """
+    Return how much slower than in <baseline> each benchmark in <results>
+    was, as a fraction of its time in <baseline>, for the benchmarks that
+    were more than <threshold> slower.
+
+    Benchmarks that are not in <baseline> are ignored.
+
+    >>> find_slowdowns({'a': 1.5, 'b': 1.1, 'c': 9.0}, {'a': 1.0, 'b': 1.0})
+    {'a': 0.5}
+    """
+    slowdowns = {}
+    for name, seconds in results.items():
+        if name in baseline:
+            slowdown = seconds / baseline[name] - 1
+            if slowdown > threshold:
+                slowdowns[name] = slowdown
+    return slowdowns
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict[str, float]:
+    """
+    Return the times saved in the baseline at <path>, or an empty baseline
+    if there is no file at <path>.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(results: dict[str, float],
+                  path: str = BASELINE_PATH) -> None:
+    """
+    Save <results> to the baseline at <path>, keeping the times of any
+    benchmarks in the baseline that are not in <results>.
+    """
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, 'w') as file:
+        json.dump(baseline, file, indent=4)
+        file.write('\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time the treemap benchmarks and compare them with a '
+                    'baseline.')
+    parser.add_argument('names', nargs='*',
+                        help='the benchmarks to run (default: all of them)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true',
+                        help='save the times as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)} (choose from "
+                     f"{', '.join(BENCHMARKS)})")
+
+    times = run_suite(args.names or None, args.repeat)
+    old_times = load_baseline(args.baseline)
+    for benchmark, seconds in times.items():
+        if benchmark in old_times:
+            change = f"{seconds / old_times[benchmark] - 1:+.1%}"
+        else:
+            change = 'no baseline'
+        print(f"{benchmark}: {seconds * 1000:.2f} ms ({change})")
+
+    if args.save:
+        save_baseline(times, args.baseline)
+        print(f"saved the baseline to {args.baseline}")
+    else:
+        slower = find_slowdowns(times, old_times, args.threshold)
+        if slower:
+            print(f"{len(slower)} benchmarks more than {args.threshold:.0%} "
+                  f"slower than the baseline: {', '.join(slower)}")
+            sys.exit(1)
@@ -0,0 +1,406 @@
+"""Assignment 2: Chess Move Tries
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module contains the code that turns a collection of chess games into a
+trie of moves, which tm_trees uses to build a ChessTree (or the nested
+dictionary returned by moves_to_nested_dict).
+
+A game is a list of moves, as strings. A move trie maps each move made from
+a position to a node, which is a list [games_ended, children]:
+games_ended is the number of games that ended immediately after the move,
+and children is the move trie of the moves made next. Moves are kept in the
+order in which they were first played.
+
+Games can be read one at a time from large files (see read_games), and the
+trie can be pruned while it is being built, so that the memory used is
+proportional to the part of the trie that is kept. Pruned moves are folded
+into a single OTHER_MOVES node, so no games are lost from the counts. A
+file with one game per line can also be split between several processes,
+each building the trie of its part of the file (see
+build_move_trie_from_file).
+"""
+from __future__ import annotations
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, TextIO
+
+# A move trie: {move: [games_ended, move trie]}
+MoveTrie = dict[str, list]
+
+# The name of the node that stands for all of the moves that were pruned
+# from a position.
+OTHER_MOVES = 'other'
+
+# How many games are added to a trie between two prunes, when games played
+# through too few games are pruned while the trie is built.
+PRUNE_EVERY = 100000
+
+# The default number of processes used by build_move_trie_from_file.
+DEFAULT_BUILD_WORKERS = os.cpu_count() or 1
+
+# How many characters of a JSON file are read at a time.
+JSON_CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+def read_games(path: str) -> Iterator[list[str]]:
+    """
+    Yield the games in the file at <path> one at a time, without reading the
+    whole file into memory.
+
+    A file whose name ends in .json holds a JSON array of games, each an
+    array of moves (the format of the wgm_*.json files). Any other file
+    holds one game per line, as moves separated by spaces (e.g. UCI moves),
+    and blank lines are skipped.
+    """
+    with open(path) as file:
+        if path.endswith('.json'):
+            yield from iter_json_games(file)
+        else:
+            yield from iter_line_games(file)
+
+
+def iter_line_games(file: TextIO) -> Iterator[list[str]]:
+    """
+    Yield the games in <file>, which holds one game per line as moves
+    separated by whitespace. Blank lines are skipped.
+
+    >>> import io
+    >>> list(iter_line_games(io.StringIO('e2e4 e7e5\\n\\nd2d4\\n')))
+    [['e2e4', 'e7e5'], ['d2d4']]
+    """
+    for line in file:
+        game = line.split()
+        if game:
+            yield game
+
+
+def iter_json_games(file: TextIO, chunk_size: int = JSON_CHUNK_SIZE) \
+        -> Iterator[list[str]]:
+    """
+    Yield the elements of the JSON array in <file> one at a time, reading
+    <chunk_size> characters at a time.
+
+    Each element is decoded as soon as all of it has been read, so only one
+    element (and one chunk) is held in memory at a time.
+
+    >>> import io
+    >>> text = '[["e2e4", "e7e5"], ["d2d4"], []]'
+    >>> list(iter_json_games(io.StringIO(text), chunk_size=4))
+    [['e2e4', 'e7e5'], ['d2d4'], []]
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    # what may come next: '[' at the start, then a value or ']' (after '['),
+    # then ',' or ']' (after a value), then a value (after ',')
+    expected = '['
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        char = buffer[pos] if pos < len(buffer) else ''
+        if expected == '[' and char == '[':
+            pos += 1
+            expected = 'value or ]'
+            continue
+        elif char == ']' and expected != 'value':
+            return
+        elif expected == ', or ]' and char == ',':
+            pos += 1
+            expected = 'value'
+            continue
+        elif expected.startswith('value') and char:
+            try:
+                game, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = len(buffer)
+            # a value that reaches the end of the buffer may continue in
+            # the rest of the file
+            if end < len(buffer) or eof:
+                yield game
+                pos = end
+                expected = ', or ]'
+                continue
+        elif char or eof:
+            raise ValueError(f"expected {expected} in the JSON array, "
+                             f"found {char or 'the end of the file'}")
+
+        chunk = file.read(chunk_size)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+
+
+def build_move_trie(games: Iterable[list[str]],
+                    trie: Optional[MoveTrie] = None,
+                    max_depth: Optional[int] = None,
+                    min_games: int = 1) -> MoveTrie:
+    """
+    Return the move trie for <games>, adding them to <trie> if it is given.
+
+    <games> is only iterated over once, so it can be any iterable of games,
+    e.g. a generator that reads them from a file. Empty games are ignored.
+
+    If <max_depth> is not None, only the first <max_depth> moves of each
+    game are kept, and the rest of a longer game is counted as an
+    OTHER_MOVES move that ends it.
+
+    If <min_games> is more than 1, the trie is pruned with prune_move_trie
+    every PRUNE_EVERY games and at the end, so that moves played in fewer
+    than <min_games> games are folded into OTHER_MOVES. Moves pruned part of
+    the way through may be added again by later games, so the result can
+    differ from pruning the complete trie.
+
+    >>> build_move_trie([['a', 'b'], ['a'], ['c'], []])
+    {'a': [1, {'b': [1, {}]}], 'c': [1, {}]}
+    >>> build_move_trie([['a', 'c']], {'a': [1, {}]})
+    {'a': [1, {'c': [1, {}]}]}
+    >>> build_move_trie([['a', 'b', 'c'], ['a']], max_depth=1)
+    {'a': [1, {'other': [1, {}]}]}
+    """
+    if trie is None:
+        trie = {}
+    for i, game in enumerate(games, 1):
+        if max_depth is not None and len(game) > max_depth:
+            game = game[:max_depth] + [OTHER_MOVES]
+        children = trie
+        node = None
+        for move in game:
+            node = children.get(move)
+            if node is None:
+                node = children[move] = [0, {}]
+            children = node[1]
+        if node is not None:
+            node[0] += 1
+        if min_games > 1 and i % PRUNE_EVERY == 0:
+            prune_move_trie(trie, min_games)
+    if min_games > 1:
+        prune_move_trie(trie, min_games)
+    return trie
+
+
+def build_move_trie_from_file(path: str,
+                              max_workers: int = DEFAULT_BUILD_WORKERS,
+                              max_depth: Optional[int] = None,
+                              min_games: int = 1) -> MoveTrie:
+    """
+    Return the move trie for the games in the file at <path> (see
+    read_games), built by <max_workers> processes.
+
+    The file is split into <max_workers> ranges of bytes, and each process
+    reads the games on the lines that start in its range, builds their trie,
+    and sends it back flattened (see _flatten_move_trie). The tries are
+    merged in the order of their ranges, so without pruning, the result is
+    the same as build_move_trie(read_games(<path>), None, <max_depth>), with
+    the moves in the same order.
+
+    With <min_games> > 1, the merged trie is pruned once, so the result is
+    the complete trie pruned by prune_move_trie, and the processes hold the
+    complete tries of their games. This is what build_move_trie returns for
+    fewer than PRUNE_EVERY games, but for more games, build_move_trie prunes
+    as it goes, which can fold more moves into OTHER_MOVES.
+
+    JSON files cannot be split this way, so they are read by this process
+    with build_move_trie, as is any file if <max_workers> is at most 1.
+    """
+    if max_workers <= 1 or path.endswith('.json'):
+        return build_move_trie(read_games(path), None, max_depth, min_games)
+
+    size = os.path.getsize(path)
+    bounds = [size * i // max_workers for i in range(max_workers + 1)]
+    trie = {}
+    with ProcessPoolExecutor(max_workers) as executor:
+        for flat in executor.map(_build_shard_trie, [path] * max_workers,
+                                 bounds[:-1], bounds[1:],
+                                 [max_depth] * max_workers):
+            _merge_flat_trie(trie, flat)
+    if min_games > 1:
+        prune_move_trie(trie, min_games)
+    return trie
+
+
+def read_shard_games(path: str, start: int, end: int) \
+        -> Iterator[list[str]]:
+    """
+    Yield the games on the lines of the file at <path> that start between
+    byte <start> (inclusive) and byte <end> (exclusive). The file holds one
+    game per line, as in read_games.
+
+    So every line is in exactly one of the shards of a list of ranges that
+    cover the file, e.g. [0, 10) and [10, size).
+    """
+    with open(path, 'rb') as file:
+        if start > 0:
+            # skip the rest of the line that byte start - 1 is on, which
+            # belongs to an earlier shard unless byte start - 1 ends it
+            file.seek(start - 1)
+            file.readline()
+        pos = file.tell()
+        while pos < end:
+            line = file.readline()
+            if not line:
+                return
+            pos += len(line)
+            game = line.decode().split()
+            if game:
+                yield game
+
+
+def _build_shard_trie(path: str, start: int, end: int,
+                      max_depth: Optional[int]) \
+        -> tuple[list[str], list[int], list[int], int]:
+    """
+    Return the flattened move trie of the games in the shard of the file at
+    <path> from byte <start> to byte <end> (see read_shard_games), keeping
+    only <max_depth> moves of each game as build_move_trie does.
+    """
+    trie = build_move_trie(read_shard_games(path, start, end), None,
+                           max_depth)
+    return _flatten_move_trie(trie)
+
+
+def _flatten_move_trie(trie: MoveTrie) \
+        -> tuple[list[str], list[int], list[int], int]:
+    """
+    Return <trie> as (moves, games ended, numbers of children, number of
+    first moves), where the first three list the nodes of <trie> in
+    preorder. A few flat lists are much faster to pickle than nested ones.
+
+    >>> _flatten_move_trie({'a': [0, {'b': [1, {}]}], 'c': [2, {}]})
+    (['a', 'b', 'c'], [0, 1, 2], [1, 0, 0], 2)
+    """
+    moves, games_ended, sizes = [], [], []
+    stack = list(reversed(trie.items()))
+    while stack:
+        move, (ended, children) = stack.pop()
+        moves.append(move)
+        games_ended.append(ended)
+        sizes.append(len(children))
+        stack.extend(reversed(children.items()))
+    return moves, games_ended, sizes, len(trie)
+
+
+def _merge_flat_trie(trie: MoveTrie,
+                     flat: tuple[list[str], list[int], list[int], int]) \
+        -> None:
+    """
+    Add the games of the trie flattened by _flatten_move_trie into <flat>
+    to <trie>. Moves that are not in <trie> yet are added after the ones
+    that are.
+
+    >>> trie = {'a': [1, {}]}
+    >>> _merge_flat_trie(trie, (['c', 'a', 'b'], [1, 0, 1], [0, 1, 0], 2))
+    >>> trie
+    {'a': [1, {'b': [1, {}]}], 'c': [1, {}]}
+    """
+    moves, games_ended, sizes, top = flat
+    # [children of a node, number of them still to be merged], innermost
+    # last
+    stack = [[trie, top]]
+    for move, ended, size in zip(moves, games_ended, sizes):
+        while stack[-1][1] == 0:
+            stack.pop()
+        frame = stack[-1]
+        frame[1] -= 1
+        node = frame[0].get(move)
+        if node is None:
+            node = frame[0][move] = [0, {}]
+        node[0] += ended
+        if size:
+            stack.append([node[1], size])
+
+
+def prune_move_trie(trie: MoveTrie, min_games: int = 1,
+                    max_depth: Optional[int] = None) -> None:
+    """
+    Prune <trie> in place, so that every move is played in at least
+    <min_games> games and, if <max_depth> is not None, no move is more than
+    <max_depth> moves deep (apart from OTHER_MOVES moves, which can be one
+    move deeper).
+
+    The moves pruned from a position are replaced by a single OTHER_MOVES
+    move, which ends the games that went through any of them. So the number
+    of games through every move that is kept does not change. OTHER_MOVES
+    moves themselves are never pruned for being played too rarely.
+
+    >>> trie = build_move_trie([['a', 'b'], ['a', 'c'], ['a', 'b'], ['d']])
+    >>> prune_move_trie(trie, min_games=2)
+    >>> trie
+    {'a': [0, {'b': [2, {}], 'other': [1, {}]}], 'other': [1, {}]}
+    >>> prune_move_trie(trie, max_depth=1)
+    >>> trie
+    {'a': [0, {'other': [3, {}]}], 'other': [1, {}]}
+    """
+    through = _games_through(trie)
+    # (trie, depth of the moves in it) pairs that are still to be pruned
+    stack = [(trie, 1)]
+    while stack:
+        children, depth = stack.pop()
+        if max_depth is not None and depth > max_depth:
+            pruned = list(children)
+        else:
+            pruned = [move for move, node in children.items()
+                      if through[id(node)] < min_games and move != OTHER_MOVES]
+        if pruned:
+            games = sum(through[id(children.pop(move))] for move in pruned)
+            other = children.setdefault(OTHER_MOVES, [0, {}])
+            other[0] += games
+        for move, node in children.items():
+            if node[1]:
+                stack.append((node[1], depth + 1))
+
+
+def _games_through(trie: MoveTrie) -> dict[int, int]:
+    """
+    Return the number of games played through each node of <trie>, i.e. the
+    number that ended at it or at one of its descendants, keyed by the id of
+    the node.
+    """
+    # every node comes before its children in preorder, so in reverse
+    # preorder the children of a node are counted before it
+    preorder = []
+    stack = list(trie.values())
+    while stack:
+        node = stack.pop()
+        preorder.append(node)
+        stack.extend(node[1].values())
+    through = {}
+    for node in reversed(preorder):
+        through[id(node)] = node[0] + sum(through[id(child)]
+                                          for child in node[1].values())
+    return through
+
+
+def trie_to_nested_dict(trie: MoveTrie) -> dict[tuple[str, int], dict]:
+    """
+    Return the nested dictionary for <trie>, in the format returned by
+    tm_trees.moves_to_nested_dict.
+
+    >>> trie_to_nested_dict({'a': [0, {'b': [1, {}]}], 'c': [2, {}]})
+    {('a', 0): {('b', 1): {}}, ('c', 2): {}}
+    """
+    nested = {}
+    # (trie to convert, dictionary to add it to) pairs
+    stack = [(trie, nested)]
+    while stack:
+        children, result = stack.pop()
+        for move, (games_ended, grandchildren) in children.items():
+            child = {}
+            result[(move, games_ended)] = child
+            if grandchildren:
+                stack.append((grandchildren, child))
+    return nested
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,187 @@
+"""Assignment 2: Treemap Layout Algorithms
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module contains the algorithms used to divide a pygame rectangle
+between the subtrees of a tree, in proportion to their sizes.
+
+Each algorithm takes the rectangle to fill and the sizes of the subtrees (in
+order), and returns one rectangle per size, in the same order. The
+rectangles exactly tile the given rectangle, and each algorithm runs in
+time linear in the number of sizes.
+"""
+from __future__ import annotations
+import math
+from typing import Callable
+
+# The names of the available layout algorithms.
+SLICE_AND_DICE = 'slice_and_dice'
+SQUARIFIED = 'squarified'
+
+Rect = tuple[int, int, int, int]
+
+
+def slice_and_dice(rect: Rect, sizes: list[int]) -> list[Rect]:
+    """
+    Return the rectangles for <sizes> when <rect> is sliced along its longer
+    side (along its width if it is wider than it is tall, and along its height
+    otherwise).
+
+    Each slice is rounded to a whole number of pixels, and the last slice
+    takes whatever is left so that the slices fill <rect> exactly.
+
+    Precondition:
+    Every value in <sizes> is > 0.
+
+    >>> slice_and_dice((0, 0, 100, 200), [5, 15])
+    [(0, 0, 100, 50), (0, 50, 100, 150)]
+    >>> slice_and_dice((0, 0, 55, 30), [20, 15, 10])
+    [(0, 0, 24, 30), (24, 0, 18, 30), (42, 0, 13, 30)]
+    """
+    if not sizes:
+        return []
+    x, y, width, height = rect
+    total = sum(sizes)
+    last = len(sizes) - 1
+    rects = []
+    offset = 0
+    if width > height:
+        for i in range(last):
+            length = round(sizes[i] / total * width)
+            rects.append((x + offset, y, length, height))
+            offset += length
+        rects.append((x + offset, y, width - offset, height))
+    else:
+        for i in range(last):
+            length = round(sizes[i] / total * height)
+            rects.append((x, y + offset, width, length))
+            offset += length
+        rects.append((x, y + offset, width, height - offset))
+    return rects
+
+
+def squarified(rect: Rect, sizes: list[int]) -> list[Rect]:
+    """
+    Return the rectangles for <sizes> when <rect> is divided into rows that
+    keep each rectangle as close to a square as possible.
+
+    This is the squarified treemap algorithm of Bruls, Huizing and van Wijk,
+    except that <sizes> are kept in their given order instead of being
+    sorted, so that the rectangles still follow the order of the subtrees and
+    the layout stays linear. Each row is laid along the shorter side of the
+    space that remains, and grows for as long as adding the next size does
+    not make its worst aspect ratio worse.
+
+    Precondition:
+    Every value in <sizes> is > 0.
+
+    >>> squarified((0, 0, 60, 40), [6, 6, 4, 3, 2, 2, 1])
+    [(0, 0, 30, 20), (0, 20, 30, 20), (30, 0, 17, 23), (47, 0, 13, 23), \
+(30, 23, 12, 17), (42, 23, 12, 17), (54, 23, 6, 17)]
+    >>> squarified((0, 0, 10, 0), [1, 1])
+    [(0, 0, 5, 0), (5, 0, 5, 0)]
+    """
+    x, y, width, height = rect
+    total = sum(sizes)
+    if not sizes or width <= 0 or height <= 0 or total <= 0:
+        return slice_and_dice(rect, sizes)
+
+    scale = width * height / total
+    # the space that remains to be filled, as floats
+    left, top, right, bottom = float(x), float(y), float(x + width), \
+        float(y + height)
+    rects = []
+    i = 0
+    while i < len(sizes):
+        side = min(right - left, bottom - top)
+        start = i
+        row_sum = row_min = row_max = sizes[i] * scale
+        worst = _worst_ratio(row_sum, row_min, row_max, side)
+        i += 1
+        while i < len(sizes):
+            area = sizes[i] * scale
+            ratio = _worst_ratio(row_sum + area, min(row_min, area),
+                                 max(row_max, area), side)
+            if ratio > worst:
+                break
+            row_sum += area
+            row_min = min(row_min, area)
+            row_max = max(row_max, area)
+            worst = ratio
+            i += 1
+
+        last_row = i == len(sizes)
+        if right - left >= bottom - top:
+            # lay the row out as a column on the left of the space
+            end = right if last_row else left + row_sum / (bottom - top)
+            _place_row(rects, sizes[start:i], scale, (left, end),
+                       (top, bottom), False)
+            left = end
+        else:
+            # lay the row out as a strip along the top of the space
+            end = bottom if last_row else top + row_sum / (right - left)
+            _place_row(rects, sizes[start:i], scale, (top, end),
+                       (left, right), True)
+            top = end
+    return rects
+
+
+def _worst_ratio(row_sum: float, row_min: float, row_max: float,
+                 side: float) -> float:
+    """
+    Return the worst aspect ratio of a row with the given total area
+    <row_sum>, smallest area <row_min> and largest area <row_max>, laid out
+    along a side of length <side>.
+    """
+    if row_min <= 0 or side <= 0:
+        return math.inf
+    side_squared = side * side
+    sum_squared = row_sum * row_sum
+    return max(side_squared * row_max / sum_squared,
+               sum_squared / (side_squared * row_min))
+
+
+def _place_row(rects: list[Rect], sizes: list[int], scale: float,
+               across: tuple[float, float], along: tuple[float, float],
+               horizontal: bool) -> None:
+    """
+    Append the rectangles for the row of <sizes> to <rects>.
+
+    The row spans <across> in the direction of its thickness and is divided
+    along <along> in proportion to <sizes>. If <horizontal> is True, the row
+    is a horizontal strip (<across> is vertical), otherwise it is a column.
+
+    Float coordinates are rounded to whole pixels at every boundary, so
+    neighbouring rectangles share their edges exactly.
+    """
+    start, end = along
+    row_area = sum(sizes) * scale
+    low, high = round(across[0]), round(across[1])
+    position = start
+    prev = round(start)
+    for i, size in enumerate(sizes):
+        if i == len(sizes) - 1:
+            position = end
+        else:
+            position += size * scale / row_area * (end - start)
+        curr = round(position)
+        if horizontal:
+            rects.append((prev, low, curr - prev, high - low))
+        else:
+            rects.append((low, prev, high - low, curr - prev))
+        prev = curr
+
+
+# The layout algorithms by name.
+LAYOUT_ALGORITHMS: dict[str, Callable[[Rect, list[int]], list[Rect]]] = {
+    SLICE_AND_DICE: slice_and_dice,
+    SQUARIFIED: squarified
+}
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,159 @@
+"""Assignment 2: Headless Treemap Rendering
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module draws treemaps straight to image files, without opening a
+window, so that treemaps of many directories can be made in a batch.
+
+A treemap is written either as a PNG, drawn on an off-screen pygame Surface
+(which does not need a display), or as an SVG, written directly from the
+rectangles of the tree. render_batch scans and draws many directories in
+parallel with a process pool.
+
+Run this module to draw the treemaps of the directories given on the command
+line, e.g.:
+
+    python tm_render.py treemaps/ /home/alice /home/bob --format svg
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import pygame
+
+from tm_trees import TMTree, path_to_nested_tuple, dir_tree_from_nested_tuple
+
+# The default size of the images, in pixels.
+WIDTH = 800
+HEIGHT = 600
+
+# The formats that treemaps can be written in.
+PNG = 'png'
+SVG = 'svg'
+
+
+def render_png(tree: TMTree, path: str) -> None:
+    """
+    Write the treemap of <tree> to a PNG file at <path>.
+
+    Precondition:
+    update_rectangles has been called on <tree>.
+    """
+    surface = pygame.Surface(tree.rect[2:])
+    for rect, colour in tree.iter_rectangles():
+        pygame.draw.rect(surface, colour, rect)
+    pygame.image.save(surface, path)
+
+
+def render_svg(tree: TMTree, path: str) -> None:
+    """
+    Write the treemap of <tree> to an SVG file at <path>.
+
+    Precondition:
+    update_rectangles has been called on <tree>.
+    """
+    with open(path, 'w') as file:
+        file.write(svg_string(tree) + '\n')
+
+
+def svg_string(tree: TMTree) -> str:
+    """
+    Return the treemap of <tree> as an SVG image.
+
+    Precondition:
+    update_rectangles has been called on <tree>.
+
+    >>> s1 = TMTree('C1', [], 5)
+    >>> s2 = TMTree('C2', [], 15)
+    >>> t3 = TMTree('C', [s1, s2], 1)
+    >>> s1._colour, s2._colour = (255, 0, 0), (0, 128, 255)
+    >>> t3.update_rectangles((0, 0, 100, 200))
+    >>> print(svg_string(t3))
+    <svg xmlns="http://www.w3.org/2000/svg" width="100" height="200">
+    <rect x="0" y="0" width="100" height="50" fill="#ff0000"/>
+    <rect x="0" y="50" width="100" height="150" fill="#0080ff"/>
+    </svg>
+    """
+    width, height = tree.rect[2:]
+    lines = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+             f'height="{height}">']
+    for (x, y, w, h), (r, g, b) in tree.iter_rectangles():
+        if w > 0 and h > 0:
+            lines.append(f'<rect x="{x}" y="{y}" width="{w}" height="{h}" '
+                         f'fill="#{r:02x}{g:02x}{b:02x}"/>')
+    lines.append('</svg>')
+    return '\n'.join(lines)
+
+
+def render_directory(root: str, path: str, size: tuple[int, int] = (WIDTH,
+                                                                   HEIGHT),
+                     image_format: str = PNG) -> str:
+    """
+    Scan the directory at <root>, draw its treemap at the given <size>, write
+    it in <image_format> to <path>, and return <path>.
+    """
+    tree = dir_tree_from_nested_tuple(path_to_nested_tuple(root))
+    tree.update_rectangles((0, 0, size[0], size[1]))
+    if image_format == SVG:
+        render_svg(tree, path)
+    else:
+        render_png(tree, path)
+    return path
+
+
+def render_batch(roots: list[str], output_dir: str,
+                 size: tuple[int, int] = (WIDTH, HEIGHT),
+                 image_format: str = PNG,
+                 max_workers: Optional[int] = None) -> list[str]:
+    """
+    Draw the treemap of every directory in <roots>, using <max_workers>
+    processes (or one per CPU if it is None), and return the paths of the
+    images, which are written to <output_dir>.
+
+    Each image is named after its directory, with its index in <roots> in
+    front so that directories with the same name do not overwrite each
+    other.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, f'{i}_{_image_name(root)}.'
+                                      f'{image_format}')
+             for i, root in enumerate(roots)]
+    n = len(roots)
+    with ProcessPoolExecutor(max_workers) as executor:
+        return list(executor.map(render_directory, roots, paths, [size] * n,
+                                 [image_format] * n))
+
+
+def _image_name(root: str) -> str:
+    """
+    Return the name of the directory at <root>, for use in a file name.
+
+    >>> _image_name(os.path.join('home', 'alice', ''))
+    'alice'
+    """
+    return os.path.basename(os.path.abspath(root)) or 'root'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Draw the treemaps of directories to image files.')
+    parser.add_argument('output_dir')
+    parser.add_argument('roots', nargs='+')
+    parser.add_argument('--format', choices=[PNG, SVG], default=PNG)
+    parser.add_argument('--width', type=int, default=WIDTH)
+    parser.add_argument('--height', type=int, default=HEIGHT)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    render_batch(args.roots, args.output_dir, (args.width, args.height),
+                 args.format, args.workers)
+    seconds = time.perf_counter() - start
+    print(f"{len(args.roots)} treemaps in {seconds:.2f} s "
+          f"({len(args.roots) / seconds:.1f} maps/s)")
@@ -0,0 +1,557 @@
+"""Assignment 2: File System Scanner
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module contains the engine used to scan a file system into the nested
+tuple format described in tm_trees.path_to_nested_tuple.
+
+Directories are listed with os.scandir, so the type of each entry comes from
+the directory listing itself and only files need an extra stat call for their
+size. Listing is fanned out over a pool of threads, which lets slow (e.g.
+network mounted) file systems serve many directories at once.
+
+Listings can also be kept in a ScanCache between runs, so that a later scan
+of the same directory only lists the directories that have changed.
+
+A BackgroundScan runs a scan on a background thread and hands out each
+listing as soon as it is read, so that a treemap of the directory can be
+shown (and filled in) while the scan goes on.
+"""
+from __future__ import annotations
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# The number of threads used to list directories when none is given.
+DEFAULT_SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# An entry of a directory listing: (name, is_dir, size).
+# The size of a directory entry is 0, since it is computed from its contents.
+Entry = tuple[str, bool, int]
+
+
+def list_directory(path: str) -> list[Entry]:
+    """
+    Return the entries of the directory at <path>, sorted by name.
+
+    Hidden files that start with "." are ignored, just as in
+    tm_trees.ordered_listdir. The size of a file is 1 + its size in bytes.
+
+    Symbolic links to directories are listed as files, so that a walk never
+    follows them: a link back to one of its own ancestors would otherwise
+    make the walk endless.
+
+    Precondition:
+    <path> is a valid path to a directory.
+
+    >>> entries = list_directory(os.path.join("example-directory", "workshop"))
+    >>> [(name, is_dir) for name, is_dir, _ in entries]
+    [('activities', True), ('draft.pptx', False), ('prep', True)]
+    """
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                entries.append((entry.name, True, 0))
+            else:
+                entries.append((entry.name, False, 1 + entry.stat().st_size))
+    entries.sort()
+    return entries
+
+
+def walk(path: str,
+         lister: Callable[[str], list[Entry]] = list_directory,
+         max_workers: int = DEFAULT_SCAN_WORKERS,
+         on_listing: Optional[Callable[[str, list[Entry]], None]] = None) \
+        -> dict[str, list[Entry]]:
+    """
+    Return a dictionary mapping the path of every directory under (and
+    including) the directory <path> to its listing, as returned by <lister>.
+
+    Listings are requested from a pool of <max_workers> threads as soon as
+    their parent directory has been listed. If <max_workers> is at most 1,
+    the directories are listed one at a time on the calling thread.
+
+    If <on_listing> is not None, it is called with the path and listing of
+    each directory as soon as the directory has been listed, on the calling
+    thread. A directory is always listed after its parent. If <on_listing>
+    raises an error, the walk is stopped and the error is raised.
+
+    Precondition:
+    <path> is a valid path to a directory.
+    """
+    listings = {}
+    if max_workers <= 1:
+        stack = [path]
+        while stack:
+            curr = stack.pop()
+            listings[curr] = lister(curr)
+            if on_listing is not None:
+                on_listing(curr, listings[curr])
+            for name, is_dir, _ in listings[curr]:
+                if is_dir:
+                    stack.append(os.path.join(curr, name))
+        return listings
+
+    done = queue.SimpleQueue()
+
+    def submit(directory: str) -> None:
+        future = pool.submit(lister, directory)
+        future.add_done_callback(lambda f: done.put((directory, f)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        submit(path)
+        outstanding = 1
+        try:
+            while outstanding:
+                directory, future = done.get()
+                outstanding -= 1
+                listings[directory] = future.result()
+                if on_listing is not None:
+                    on_listing(directory, listings[directory])
+                for name, is_dir, _ in listings[directory]:
+                    if is_dir:
+                        submit(os.path.join(directory, name))
+                        outstanding += 1
+        except BaseException:
+            # don't wait for the directories that are still to be listed
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    return listings
+
+
+class _ScanCancelled(Exception):
+    """Raised to stop the walk of a BackgroundScan that was cancelled."""
+
+
+class BackgroundScan:
+    """
+    A scan of a directory that runs on a background thread, and publishes
+    the listing of each directory as soon as it has been read, so that they
+    can be used (e.g. displayed) before the whole scan is done.
+
+    The listings are taken, in the order they were read, with get_listings.
+
+    === Private Attributes ===
+    _listings:
+        The (path, listing) pairs that have been read but not taken yet,
+        followed by None once the scan has ended.
+    _cancelled:
+        Set when the scan is cancelled.
+    _thread:
+        The thread that runs the scan.
+    _error:
+        The error that stopped the scan, or None (once it has been raised by
+        get_listings).
+    _done:
+        Whether the scan has ended and all of its listings have been taken.
+    """
+    _listings: queue.SimpleQueue
+    _cancelled: threading.Event
+    _thread: threading.Thread
+    _error: Optional[Exception]
+    _done: bool
+
+    def __init__(self, path: str,
+                 max_workers: int = DEFAULT_SCAN_WORKERS) -> None:
+        """Initialize a new BackgroundScan and start scanning the directory
+        at <path>, listing directories with <max_workers> threads (see walk).
+
+        Precondition:
+        <path> is a valid path to a directory.
+        """
+        self._listings = queue.SimpleQueue()
+        self._cancelled = threading.Event()
+        self._error = None
+        self._done = False
+        self._thread = threading.Thread(target=self._run,
+                                        args=(path, max_workers), daemon=True)
+        self._thread.start()
+
+    def _run(self, path: str, max_workers: int) -> None:
+        """Scan the directory at <path>, publishing each listing."""
+        def publish(directory: str, listing: list[Entry]) -> None:
+            if self._cancelled.is_set():
+                raise _ScanCancelled
+            self._listings.put((directory, listing))
+
+        try:
+            walk(path, max_workers=max_workers, on_listing=publish)
+        except _ScanCancelled:
+            pass
+        except Exception as error:
+            self._error = error
+        finally:
+            self._listings.put(None)
+
+    def get_listings(self, max_count: Optional[int] = None) \
+            -> list[tuple[str, list[Entry]]]:
+        """
+        Return the (path, listing) pairs of the directories read since the
+        last call, oldest first, without waiting for any more. If
+        <max_count> is not None, return at most <max_count> of them, and
+        leave the rest for the next call.
+
+        Every directory is returned after its parent. If the scan failed,
+        the error that stopped it is raised once all of the listings read
+        before it have been returned.
+
+        >>> path = os.path.join("example-directory", "workshop")
+        >>> scan = BackgroundScan(path, max_workers=1)
+        >>> scan.wait()
+        >>> [(os.path.relpath(directory, path).replace(os.sep, '/'),
+        ...   len(listing)) for directory, listing in scan.get_listings()]
+        [('.', 3), ('prep', 2), ('prep/images', 1), ('activities', 2), \
+('activities/images', 2)]
+        >>> scan.is_done()
+        True
+        """
+        result = []
+        while not self._done \
+                and (max_count is None or len(result) < max_count):
+            try:
+                item = self._listings.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._done = True
+            else:
+                result.append(item)
+        if not result and self._done and self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        return result
+
+    def is_done(self) -> bool:
+        """Return whether the scan has ended, and all of its listings (and
+        the error that stopped it, if it failed) have been returned by
+        get_listings.
+        """
+        return self._done and self._error is None
+
+    def wait(self) -> None:
+        """Wait until the scan has ended."""
+        self._thread.join()
+
+    def cancel(self) -> None:
+        """Stop the scan as soon as possible. Listings that were already read
+        can still be taken with get_listings.
+        """
+        self._cancelled.set()
+
+
+def list_directories(paths: list[str],
+                     max_workers: int = DEFAULT_SCAN_WORKERS) \
+        -> list[list[Entry]]:
+    """
+    Return the listings of the directories at <paths>, in the same order,
+    using up to <max_workers> threads.
+
+    Precondition:
+    Every path in <paths> is a valid path to a directory.
+    """
+    if max_workers <= 1 or len(paths) <= 1:
+        return [list_directory(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(list_directory, paths))
+
+
+def directory_sizes(path: str, max_workers: int = DEFAULT_SCAN_WORKERS) \
+        -> dict[str, int]:
+    """
+    Return a dictionary mapping the path of every directory under (and
+    including) the directory <path> to its total size.
+
+    The total size of a directory is 1 + the sizes of everything it contains,
+    which is the data_size a DirectoryTree for it would have.
+
+    Precondition:
+    <path> is a valid path to a directory.
+
+    >>> path = os.path.join("example-directory", "workshop", "prep")
+    >>> sizes = directory_sizes(path)
+    >>> sizes[path], sizes[os.path.join(path, "images")]
+    (26, 18)
+    """
+    return aggregate_sizes(path, walk(path, max_workers=max_workers))
+
+
+def aggregate_sizes(path: str,
+                    listings: dict[str, list[Entry]]) -> dict[str, int]:
+    """
+    Return the total size of every directory under (and including) the
+    directory at <path>, computed from the directory <listings> produced by
+    walk. See directory_sizes for the definition of the total size.
+    """
+    sizes = {}
+    stack = [(path, False)]
+    while stack:
+        directory, visited = stack.pop()
+        if visited:
+            total = 1
+            for name, is_dir, size in listings[directory]:
+                if is_dir:
+                    total += sizes[os.path.join(directory, name)]
+                else:
+                    total += size
+            sizes[directory] = total
+        else:
+            stack.append((directory, True))
+            for name, is_dir, _ in listings[directory]:
+                if is_dir:
+                    stack.append((os.path.join(directory, name), False))
+    return sizes
+
+
+def assemble(path: str, name: str,
+             listings: dict[str, list[Entry]]) -> tuple[str, int | list]:
+    """
+    Return the nested tuple named <name> for the directory at <path>, built
+    from the directory <listings> produced by walk.
+
+    Precondition:
+    <listings> contains a listing for <path> and every directory below it.
+    """
+    root = (name, [])
+    stack = [(path, root[1])]
+    while stack:
+        directory, contents = stack.pop()
+        for entry_name, is_dir, size in listings[directory]:
+            if is_dir:
+                child = (entry_name, [])
+                contents.append(child)
+                stack.append((os.path.join(directory, entry_name), child[1]))
+            else:
+                contents.append((entry_name, size))
+    return root
+
+
+def scan_nested_tuple(path: str, max_workers: int = DEFAULT_SCAN_WORKERS) \
+        -> tuple[str, int | list]:
+    """
+    Return a nested tuple representing the files and directories rooted at
+    <path>, using <max_workers> threads to list directories.
+
+    See tm_trees.path_to_nested_tuple for the format of the result.
+
+    Precondition:
+    <path> is a valid path to a FILE or a DIRECTORY.
+
+    >>> path = os.path.join("example-directory", "workshop", "prep")
+    >>> scan_nested_tuple(path, max_workers=4)
+    ('prep', [('images', [('Cats.pdf', 17)]), ('reading.md', 7)])
+    """
+    name = os.path.basename(path)
+    if not os.path.isdir(path):
+        return name, 1 + os.path.getsize(path)
+    return assemble(path, name, walk(path, max_workers=max_workers))
+
+
+class ScanCache:
+    """
+    A record of the directory listings under a root directory, stored in an
+    SQLite database so that it persists between runs.
+
+    A directory's modification time changes whenever an entry is added to,
+    removed from or renamed in it, so rescanning only lists the directories
+    whose modification time (or inode) differs from the one recorded with
+    their cached listing. Every other directory costs a single stat call.
+
+    Note: a file that changes size in place does not change the modification
+    time of its directory, so its cached size is kept until its directory
+    changes for another reason.
+
+    Directories are recorded by their path as joined from the root passed to
+    scan, so the same root path should be used each time.
+
+    === Public Attributes ===
+    path:
+        The path of the database file.
+
+    === Private Attributes ===
+    _root:
+        The root directory of the cached listings, or None if nothing has
+        been scanned yet.
+    _listings:
+        The listing of each directory under _root, by path.
+    _stamps:
+        The (modification time in nanoseconds, inode) of each directory in
+        _listings when it was listed.
+    _changed:
+        The directories listed since the cache was last saved.
+    _removed:
+        The directories that disappeared since the cache was last saved.
+    _lock:
+        Guards _listings, _stamps and _changed while scanning.
+    """
+    path: str
+    _root: Optional[str]
+    _listings: dict[str, list[Entry]]
+    _stamps: dict[str, tuple[int, int]]
+    _changed: set[str]
+    _removed: set[str]
+    _lock: threading.Lock
+
+    def __init__(self, path: str) -> None:
+        """Initialize a new ScanCache stored in the database file at <path>,
+        loading any listings already saved there.
+        """
+        self.path = path
+        self._root = None
+        self._listings = {}
+        self._stamps = {}
+        self._changed = set()
+        self._removed = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return a connection to the database, creating its tables if they
+        do not exist yet.
+        """
+        connection = sqlite3.connect(self.path)
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY, mtime_ns INTEGER, inode INTEGER);
+            CREATE TABLE IF NOT EXISTS entries (
+                directory TEXT, name TEXT, is_dir INTEGER, size INTEGER);
+            CREATE INDEX IF NOT EXISTS entries_directory
+                ON entries (directory);
+        """)
+        return connection
+
+    def _load(self) -> None:
+        """Load the listings saved in the database."""
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT value FROM meta WHERE key = 'root'").fetchone()
+            self._root = row[0] if row else None
+            for path, mtime_ns, inode in connection.execute(
+                    "SELECT path, mtime_ns, inode FROM directories"):
+                self._stamps[path] = (mtime_ns, inode)
+                self._listings[path] = []
+            for directory, name, is_dir, size in connection.execute(
+                    "SELECT directory, name, is_dir, size FROM entries"):
+                self._listings[directory].append((name, bool(is_dir), size))
+        finally:
+            connection.close()
+        for listing in self._listings.values():
+            listing.sort()
+
+    def save(self) -> None:
+        """Save the directories that were listed or removed since the last
+        save to the database.
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('root', ?)",
+                    (self._root,))
+                stale = [(path,) for path in self._changed | self._removed]
+                connection.executemany(
+                    "DELETE FROM directories WHERE path = ?", stale)
+                connection.executemany(
+                    "DELETE FROM entries WHERE directory = ?", stale)
+                connection.executemany(
+                    "INSERT INTO directories VALUES (?, ?, ?)",
+                    ((path,) + self._stamps[path] for path in self._changed))
+                connection.executemany(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                    ((path, name, int(is_dir), size)
+                     for path in self._changed
+                     for name, is_dir, size in self._listings[path]))
+        finally:
+            connection.close()
+        self._changed.clear()
+        self._removed.clear()
+
+    def _list_if_changed(self, path: str) -> list[Entry]:
+        """Return the listing of the directory at <path>, listing it again
+        only if it changed since its cached listing was made.
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_ino)
+        with self._lock:
+            if self._stamps.get(path) == stamp:
+                return self._listings[path]
+        listing = list_directory(path)
+        with self._lock:
+            self._stamps[path] = stamp
+            self._listings[path] = listing
+            self._changed.add(path)
+        return listing
+
+    def scan(self, root: str, max_workers: int = DEFAULT_SCAN_WORKERS) \
+            -> dict[str, list[Entry]]:
+        """
+        Return the listing of every directory under (and including) the
+        directory <root>, listing only the directories that changed since
+        they were cached. See walk for the format of the result.
+
+        If <root> is not the root of the cached listings, everything under
+        it is listed and the cached listings are replaced.
+
+        Precondition:
+        <root> is a valid path to a directory.
+        """
+        if root != self._root:
+            self._removed.update(self._listings)
+            self._listings = {}
+            self._stamps = {}
+            self._changed = set()
+            self._root = root
+        listings = walk(root, self._list_if_changed, max_workers)
+        for path in list(self._listings):
+            if path not in listings:
+                del self._listings[path]
+                del self._stamps[path]
+                self._changed.discard(path)
+                self._removed.add(path)
+        return listings
+
+    def scan_nested_tuple(self, root: str,
+                          max_workers: int = DEFAULT_SCAN_WORKERS) \
+            -> tuple[str, int | list]:
+        """
+        Return a nested tuple representing the files and directories rooted
+        at the directory <root>, listing only the directories that changed
+        since they were cached.
+
+        See tm_trees.path_to_nested_tuple for the format of the result.
+
+        Precondition:
+        <root> is a valid path to a directory.
+        """
+        return assemble(root, os.path.basename(root),
+                        self.scan(root, max_workers))
+
+    def directory_sizes(self, root: str,
+                        max_workers: int = DEFAULT_SCAN_WORKERS) \
+            -> dict[str, int]:
+        """
+        Return the total size of every directory under (and including) the
+        directory <root>, listing only the directories that changed since
+        they were cached. See the directory_sizes function for details.
+
+        Precondition:
+        <root> is a valid path to a directory.
+        """
+        return aggregate_sizes(root, self.scan(root, max_workers))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,338 @@
+"""Assignment 2: Treemap Snapshots
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module saves a TMTree (or a DirectoryTree or ChessTree) to a compact
+binary snapshot file, and loads it back by memory-mapping the file, so that a
+large tree can be reopened without scanning the file system or parsing games
+again.
+
+A snapshot stores the trees in preorder, as columns with one entry per tree:
+
+- data_size: the data_size of the tree (signed 64 bit)
+- name_end: the offset of the end of the tree's name in the string table
+  (signed 64 bit), so the name of tree i is between name_end[i - 1] (or 0)
+  and name_end[i]
+- parent: the index of the tree's parent, or -1 for the root (signed 32 bit)
+- end: one more than the index of the tree's last descendant (signed 32
+  bit), so the subtrees of tree i start at i + 1, and each one is followed
+  by the next at its own end
+- colour: the tree's colour, as 0xRRGGBB (unsigned 32 bit)
+- flags: the kind of tree (see KIND_MASK), whether it is expanded, and
+  whether it is white's turn to play in a ChessTree (unsigned 8 bit)
+
+followed by the names of the trees, encoded in UTF-8, as the string table.
+The columns are in the native byte order of the machine that wrote them,
+which is recorded in the header.
+
+Loading a snapshot reads nothing but the header. Trees are created from the
+columns only when the visualiser needs them: the root to start with, and the
+subtrees of a tree when it is expanded (through the _load_subtrees hook that
+LazyDirectoryTree uses too).
+"""
+from __future__ import annotations
+import mmap
+import struct
+import sys
+from array import array
+from typing import Optional
+
+from tm_trees import TMTree, FileTree, DirectoryTree, ChessTree
+
+# The first bytes of every snapshot file.
+MAGIC = b'TMSNAP01'
+
+# The header: MAGIC, the byte order of the columns ('l' or 'b', for little
+# or big), the number of trees, and the length of the string table, padded
+# so that the columns after it are aligned.
+_HEADER = struct.Struct('<8sc7xqq')
+
+# The kinds of tree, stored in the lowest bits of flags.
+KIND_TMTREE = 0
+KIND_FILE = 1
+KIND_DIRECTORY = 2
+KIND_CHESS = 3
+KIND_MASK = 3
+
+# The other flags.
+EXPANDED = 4
+WHITE_TO_PLAY = 8
+
+# The columns, in the order they are stored, with their array typecodes.
+_COLUMNS = (('data_size', 'q'), ('name_end', 'q'), ('parent', 'i'),
+            ('end', 'i'), ('colour', 'I'), ('flags', 'B'))
+
+
+def _kind(tree: TMTree) -> int:
+    """
+    Return the kind of <tree>, as stored in the flags of a snapshot.
+    """
+    if isinstance(tree, ChessTree):
+        return KIND_CHESS
+    elif isinstance(tree, DirectoryTree):
+        return KIND_DIRECTORY
+    elif isinstance(tree, FileTree):
+        return KIND_FILE
+    return KIND_TMTREE
+
+
+def save_snapshot(tree: TMTree, path: str) -> None:
+    """
+    Save <tree> and all of its descendants to a snapshot file at <path>.
+
+    Trees whose subtrees are created on demand (e.g. a LazyDirectoryTree, or
+    a tree loaded from a snapshot) are saved with all of their subtrees, so
+    they are all created first.
+
+    >>> import os, tempfile
+    >>> s1 = TMTree('C1', [], 5)
+    >>> s2 = TMTree('C2', [], 15)
+    >>> path = os.path.join(tempfile.mkdtemp(), 'tree.tms')
+    >>> save_snapshot(TMTree('C', [s1, s2], 1), path)
+    >>> tree = load_snapshot(path)
+    >>> print(tree)
+    C(21) None
+    >>> tree.expand() is tree._subtrees[0]
+    True
+    >>> print(tree)
+    C | (21) None
+        C1(5) None
+        C2(15) None
+    >>> tree._subtrees[1]._colour == s2._colour
+    True
+    """
+    # creating the subtrees of a tree can change the data_size of its
+    # ancestors, so they are all created before anything is saved
+    tree._load_subtrees()
+    trees = [tree]
+    for t in tree.iter_descendants():
+        t._load_subtrees()
+        trees.append(t)
+    index = {id(t): i for i, t in enumerate(trees)}
+    columns = {name: array(typecode) for name, typecode in _COLUMNS}
+    names = bytearray()
+    for t in trees:
+        columns['data_size'].append(t.data_size)
+        names += t._name.encode()
+        columns['name_end'].append(len(names))
+        columns['parent'].append(-1 if t is tree
+                                 else index[id(t._parent_tree)])
+        columns['colour'].append(t._rgb)
+        flags = _kind(t)
+        if t._expanded:
+            flags |= EXPANDED
+        if isinstance(t, ChessTree) and t._white_to_play:
+            flags |= WHITE_TO_PLAY
+        columns['flags'].append(flags)
+
+    # every tree is after its parent in preorder, so the end of each tree is
+    # known before it is used for its parent
+    end = columns['end']
+    end.extend(range(1, len(trees) + 1))
+    parent = columns['parent']
+    for i in range(len(trees) - 1, 0, -1):
+        end[parent[i]] = max(end[parent[i]], end[i])
+
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, sys.byteorder[0].encode(), len(trees),
+                                len(names)))
+        for name, _ in _COLUMNS:
+            columns[name].tofile(file)
+        file.write(names)
+
+
+def load_snapshot(path: str, restore_expanded: bool = False) -> TMTree:
+    """
+    Return the root of the tree in the snapshot file at <path>.
+
+    The file is memory-mapped, and only the root is created. The subtrees of
+    a tree are created from the file when it is expanded, so every tree
+    starts collapsed, unless <restore_expanded> is True. In that case, the
+    trees that were expanded when the snapshot was saved are expanded again,
+    which creates all of their subtrees now.
+
+    Raise a ValueError if the file at <path> is not a snapshot that can be
+    read on this machine.
+    """
+    with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    snapshot = _Snapshot(data)
+    root = snapshot.create(0)
+    if restore_expanded:
+        stack = [root]
+        while stack:
+            tree = stack.pop()
+            if isinstance(tree, _SnapshotTree) \
+                    and snapshot.flags[tree._index] & EXPANDED:
+                tree._load_subtrees()
+                tree._expanded = True
+                stack.extend(tree._subtrees)
+    return root
+
+
+class _Snapshot:
+    """
+    The columns of a memory-mapped snapshot file, read directly from the
+    memory map without copying them.
+
+    === Private Attributes ===
+    _data:
+        The memory map of the file.
+    _names:
+        The string table.
+    The columns data_size, name_end, parent, end, colour and flags are also
+    attributes, as memoryviews of the memory map.
+    """
+    _data: mmap.mmap
+    _names: memoryview
+    data_size: memoryview
+    name_end: memoryview
+    parent: memoryview
+    end: memoryview
+    colour: memoryview
+    flags: memoryview
+
+    def __init__(self, data: mmap.mmap) -> None:
+        """Initialize a new _Snapshot from the memory-mapped file <data>.
+
+        Raise a ValueError if <data> is not a snapshot that can be read on
+        this machine.
+        """
+        if len(data) < _HEADER.size:
+            raise ValueError("not a treemap snapshot")
+        magic, byteorder, n, names_length = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a treemap snapshot")
+        if byteorder != sys.byteorder[0].encode():
+            raise ValueError("the snapshot was saved on a machine with a "
+                             "different byte order")
+        self._data = data
+        view = memoryview(data)
+        offset = _HEADER.size
+        for name, typecode in _COLUMNS:
+            size = n * array(typecode).itemsize
+            setattr(self, name, view[offset:offset + size].cast(typecode))
+            offset += size
+        self._names = view[offset:offset + names_length]
+        if len(self._names) != names_length:
+            raise ValueError("the snapshot is truncated")
+
+    def create(self, i: int) -> TMTree:
+        """
+        Return a new tree for the tree with index <i>, with no parent and,
+        if it has any subtrees, with none of them created yet.
+        """
+        start = self.name_end[i - 1] if i > 0 else 0
+        name = str(self._names[start:self.name_end[i]], 'utf-8')
+        flags = self.flags[i]
+        kind = flags & KIND_MASK
+        if self.end[i] == i + 1:
+            tree = _LEAF_CLASSES[kind].__new__(_LEAF_CLASSES[kind])
+        else:
+            tree = _SNAPSHOT_CLASSES[kind].__new__(_SNAPSHOT_CLASSES[kind])
+            tree._snapshot = self
+            tree._index = i
+        TMTree.__init__(tree, name, [], self.data_size[i])
+        tree._rgb = self.colour[i]
+        if kind == KIND_CHESS:
+            tree._white_to_play = bool(flags & WHITE_TO_PLAY)
+        return tree
+
+    def create_subtrees(self, i: int) -> list[TMTree]:
+        """
+        Return new trees for the subtrees of the tree with index <i>.
+        """
+        subtrees = []
+        j = i + 1
+        end = self.end[i]
+        while j < end:
+            subtrees.append(self.create(j))
+            j = self.end[j]
+        return subtrees
+
+
+class _SnapshotTree:
+    """
+    A tree loaded from a snapshot, whose subtrees are created from the
+    snapshot when it is first expanded.
+
+    This class only adds behaviour. The classes that use it (which are also
+    subclasses of TMTree) have these attributes:
+
+    === Private Attributes ===
+    _snapshot:
+        The snapshot this tree was loaded from, or None once its subtrees
+        have been created.
+    _index:
+        The index of this tree in the snapshot.
+    """
+    __slots__ = ()
+
+    _snapshot: Optional[_Snapshot]
+    _index: int
+
+    def _load_subtrees(self) -> None:
+        """Create the subtrees of this tree from its snapshot, if they have
+        not been created already.
+
+        Any trees already moved into this tree are kept after the subtrees
+        that were created.
+        """
+        if self._snapshot is None:
+            return
+        subtrees = self._snapshot.create_subtrees(self._index)
+        for t in subtrees:
+            t._parent_tree = self
+        self._subtrees[:0] = subtrees
+        self._snapshot = None
+        # the new subtrees are not displayed (and so need not be laid out)
+        # until this tree is expanded, which marks it to be laid out again
+
+
+class SnapshotTMTree(_SnapshotTree, TMTree):
+    """A TMTree loaded from a snapshot (see _SnapshotTree)."""
+    __slots__ = ('_snapshot', '_index')
+
+
+class SnapshotDirectoryTree(_SnapshotTree, DirectoryTree):
+    """A DirectoryTree loaded from a snapshot (see _SnapshotTree)."""
+    __slots__ = ('_snapshot', '_index')
+
+
+class SnapshotChessTree(_SnapshotTree, ChessTree):
+    """A ChessTree loaded from a snapshot (see _SnapshotTree)."""
+    __slots__ = ('_snapshot', '_index')
+
+    def get_suffix(self) -> str:
+        """
+        Return the suffix of this ChessTree (see ChessTree.get_suffix), which
+        depends on whether it has subtrees, so they are created first.
+        """
+        self._load_subtrees()
+        return ChessTree.get_suffix(self)
+
+    def pruned_view(self, max_depth: Optional[int] = None,
+                    min_games: int = 1) -> ChessTree:
+        """
+        Return a pruned copy of this ChessTree (see ChessTree.pruned_view),
+        creating all of its descendants first.
+        """
+        for _ in self.iter_descendants():
+            pass
+        return ChessTree.pruned_view(self, max_depth, min_games)
+
+
+# The class of the trees of each kind, for trees with and without subtrees.
+_LEAF_CLASSES = {KIND_TMTREE: TMTree, KIND_FILE: FileTree,
+                 KIND_DIRECTORY: DirectoryTree, KIND_CHESS: ChessTree}
+_SNAPSHOT_CLASSES = {KIND_TMTREE: SnapshotTMTree, KIND_FILE: SnapshotTMTree,
+                     KIND_DIRECTORY: SnapshotDirectoryTree,
+                     KIND_CHESS: SnapshotChessTree}
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,293 @@
+"""Assignment 2: Phase Timing and Profiling
+
+=== CSC148 Winter 2023 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This module measures where the time of the treemap program goes. The work is
+divided into named phases (e.g. 'update_rectangles' or 'draw'), and for each
+phase it records how many times it ran, how long it took, and counts of the
+work it did (e.g. the number of nodes it visited).
+
+Nothing is recorded until enable is called, and until then the cost of a
+phase is a single check of a flag. The visualiser uses the recorded times to
+draw a HUD showing where the time of each frame went (see
+treemap_visualiser.run_visualisation).
+
+When profiling is turned on, every phase also has its own cProfile profile
+and (optionally) counts the memory allocated with tracemalloc, and dump
+writes the profiles and memory statistics to a directory. The profile of a
+phase leaves out the time spent in the phases nested in it.
+
+>>> enable()
+>>> with phase('outer'):
+...     with phase('inner'):
+...         count('inner', 'nodes', 3)
+...     count('inner', 'nodes', 2)
+>>> stats = take_frame()
+>>> stats['outer'].calls, stats['inner'].calls, stats['inner'].counts
+(1, 1, {'nodes': 5})
+>>> stats['outer'].seconds >= stats['inner'].seconds
+True
+>>> take_frame()
+{}
+>>> totals()['inner'].counts
+{'nodes': 5}
+>>> disable()
+"""
+from __future__ import annotations
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import nullcontext
+from functools import wraps
+from typing import Any, Callable, ContextManager, Optional
+
+# How many functions are listed in the report of the profile of each phase,
+# and how many lines in the report of the memory allocated.
+REPORT_LINES = 30
+
+# Whether phases are being recorded. Use enable and disable to change it.
+enabled = False
+
+# The stats of the phases since the last call to take_frame, and since
+# enable was called (not counting the ones since the last take_frame).
+_frame: dict[str, PhaseStats] = {}
+_totals: dict[str, PhaseStats] = {}
+
+# The phases that are running, innermost last.
+_running: list[_Phase] = []
+
+# The profile of each phase, or None if phases are not being profiled.
+_profiles: Optional[dict[str, cProfile.Profile]] = None
+
+_NO_PHASE = nullcontext()
+
+
+class PhaseStats:
+    """
+    What was recorded about a phase.
+
+    === Public Attributes ===
+    calls:
+        The number of times the phase ran.
+    seconds:
+        The total time the phase took, including the time of any phases
+        nested in it.
+    counts:
+        The totals of the counts of the work done by the phase, by the name
+        of what was counted. If memory is traced, 'bytes' is the total
+        number of bytes allocated (less those freed) during the phase.
+    """
+    calls: int
+    seconds: float
+    counts: dict[str, int]
+
+    __slots__ = ('calls', 'seconds', 'counts')
+
+    def __init__(self) -> None:
+        """Initialize a new PhaseStats for a phase that has not run."""
+        self.calls = 0
+        self.seconds = 0.0
+        self.counts = {}
+
+    def add(self, other: PhaseStats) -> None:
+        """Add what was recorded in <other> to this PhaseStats."""
+        self.calls += other.calls
+        self.seconds += other.seconds
+        for name, n in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def __str__(self) -> str:
+        """
+        Return a one line summary of this PhaseStats.
+
+        >>> stats = PhaseStats()
+        >>> stats.calls, stats.seconds, stats.counts = 2, 0.0015, {'rects': 9}
+        >>> str(stats)
+        '1.50 ms, calls=2, rects=9'
+        """
+        counts = ''.join(f", {name}={n}" for name, n in self.counts.items())
+        return f"{self.seconds * 1000:.2f} ms, calls={self.calls}{counts}"
+
+
+class _Phase:
+    """
+    A context manager that records one run of the phase <name>.
+    """
+    name: str
+    start: float
+    memory: int
+
+    __slots__ = ('name', 'start', 'memory')
+
+    def __init__(self, name: str) -> None:
+        """Initialize a new _Phase for the phase <name>."""
+        self.name = name
+        self.start = 0.0
+        self.memory = 0
+
+    def __enter__(self) -> None:
+        """Start recording the phase."""
+        if _profiles is not None:
+            if _running and _running[-1].name in _profiles:
+                _profiles[_running[-1].name].disable()
+            _profiles.setdefault(self.name, cProfile.Profile()).enable()
+        if tracemalloc.is_tracing():
+            self.memory = tracemalloc.get_traced_memory()[0]
+        _running.append(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Stop recording the phase, and add what was recorded to its stats.
+        """
+        seconds = time.perf_counter() - self.start
+        _running.pop()
+        # profiling may have been turned on while the phase was running
+        if _profiles is not None and self.name in _profiles:
+            _profiles[self.name].disable()
+            if _running and _running[-1].name in _profiles:
+                _profiles[_running[-1].name].enable()
+        stats = _stats(self.name)
+        stats.calls += 1
+        stats.seconds += seconds
+        if tracemalloc.is_tracing():
+            allocated = tracemalloc.get_traced_memory()[0] - self.memory
+            stats.counts['bytes'] = stats.counts.get('bytes', 0) + allocated
+
+
+def _stats(name: str) -> PhaseStats:
+    """
+    Return the stats of the phase <name> in the current frame.
+    """
+    stats = _frame.get(name)
+    if stats is None:
+        stats = _frame[name] = PhaseStats()
+    return stats
+
+
+def enable(profile: bool = False, trace_memory: bool = False) -> None:
+    """
+    Start recording phases. If <profile> is True, profile each phase with
+    cProfile, and if <trace_memory> is True, trace the memory allocated by
+    each phase with tracemalloc.
+
+    Anything recorded before is forgotten.
+    """
+    global enabled, _profiles
+    enabled = True
+    _frame.clear()
+    _totals.clear()
+    _profiles = {} if profile else None
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable() -> None:
+    """
+    Stop recording phases, and stop tracing memory if it was being traced.
+    What was recorded is kept until enable is called again.
+    """
+    global enabled
+    enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def phase(name: str) -> ContextManager:
+    """
+    Return a context manager that records the phase <name> while it is
+    entered, if phases are being recorded.
+    """
+    if not enabled:
+        return _NO_PHASE
+    return _Phase(name)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """
+    Return a decorator that records each call of the function it decorates
+    as the phase <name>.
+    """
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not enabled:
+                return function(*args, **kwargs)
+            with _Phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, counter: str, n: int = 1) -> None:
+    """
+    Add <n> to the count <counter> of the phase <name>, if phases are being
+    recorded.
+    """
+    if enabled:
+        counts = _stats(name).counts
+        counts[counter] = counts.get(counter, 0) + n
+
+
+def take_frame() -> dict[str, PhaseStats]:
+    """
+    Return the stats of the phases recorded since the last call to
+    take_frame (e.g. during the last frame of the visualiser), and start
+    recording a new frame.
+    """
+    global _frame
+    frame = _frame
+    _frame = {}
+    for name, stats in frame.items():
+        _totals.setdefault(name, PhaseStats()).add(stats)
+    return frame
+
+
+def totals() -> dict[str, PhaseStats]:
+    """
+    Return the stats of all of the phases recorded since enable was called.
+    """
+    result = {}
+    for stats in (_totals, _frame):
+        for name, phase_stats in stats.items():
+            result.setdefault(name, PhaseStats()).add(phase_stats)
+    return result
+
+
+def dump(directory: str) -> None:
+    """
+    Write what was recorded to <directory>, creating it if necessary:
+
+    - summary.txt: the totals of each phase
+    - <phase>.prof and <phase>.txt: the cProfile profile of each phase, as
+      read by pstats, and a report of its REPORT_LINES slowest functions
+      (only if phases were profiled)
+    - memory.txt: the REPORT_LINES lines that allocated the most memory that
+      is still allocated (only if memory is being traced)
+    """
+    # the snapshot is taken first, so that it does not include the memory
+    # used to write the other reports
+    snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() \
+        else None
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'summary.txt'), 'w') as file:
+        for name, stats in sorted(totals().items()):
+            file.write(f"{name}: {stats}\n")
+    for name, profile in (_profiles or {}).items():
+        profile.dump_stats(os.path.join(directory, f'{name}.prof'))
+        with open(os.path.join(directory, f'{name}.txt'), 'w') as file:
+            report = pstats.Stats(profile, stream=file)
+            report.sort_stats('cumulative').print_stats(REPORT_LINES)
+    if snapshot is not None:
+        with open(os.path.join(directory, 'memory.txt'), 'w') as file:
+            for statistic in snapshot.statistics('lineno')[:REPORT_LINES]:
+                file.write(f"{statistic}\n")
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
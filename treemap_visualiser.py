@@ -11,15 +11,19 @@ concrete subclass, of course), rendering it to the user using pygame,
 and detecting user events like mouse clicks and key presses and responding
 to them.
 """
-import json
 import os
+from bisect import bisect_left
+from functools import lru_cache
 from typing import Optional
 import pygame
 
 from tm_trees import TMTree, path_to_nested_tuple
-from tm_trees import ChessTree, dir_tree_from_nested_tuple, \
-    moves_to_nested_dict, get_worksheet_tree
+from tm_trees import dir_tree_from_nested_tuple, chess_tree_from_file, \
+    get_worksheet_tree, lazy_dir_tree_from_path, DirectoryTreeBuilder
 from tm_trees import OperationNotSupportedError
+from tm_scan import ScanCache
+from tm_snapshot import load_snapshot
+import tm_stats
 
 # Screen dimensions and coordinates
 # You may adjust these values as you'd like.
@@ -33,6 +37,9 @@ FONT_ROWS = 1  # Initially, how many rows of text we leave room for in display
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
+# trees narrower or shorter than this many pixels are drawn as one rectangle
+MIN_RECT_SIZE = 2
+
 SELECTED_HIGHLIGHT = 5  # width of rectangle around the selected rectangle
 HOVER_HIGHLIGHT = 2  # width of rectangle around the hovered rectangle
 
@@ -43,9 +50,39 @@ BLACK = pygame.color.THECOLORS['black']
 
 ANTI_ALIAS = True
 
+# how many distinct texts keep their rendered surfaces cached
+TEXT_CACHE_SIZE = 64
+
+# the most times per second that the display is updated
+MAX_FPS = 60
+# the longest time (in milliseconds) to sleep while waiting for an event
+EVENT_WAIT_TIMEOUT = 1000
+
+# while a directory is scanned in the background, how often (in
+# milliseconds) the listings read so far are added to the treemap, and the
+# most listings added at a time, so that a frame never waits for a long batch
+SCAN_UPDATE_INTERVAL = 100
+SCAN_BATCH_SIZE = 500
+
 # the factor used when changing the size of a node
 DELTA = 0.01
 
+# whether the HUD with the time taken by each phase of the last frame is
+# shown when the visualiser starts, and the key that turns it on and off
+SHOW_HUD = False
+HUD_KEY = pygame.K_h
+# the phases shown in the HUD, in order, and its width in pixels
+HUD_PHASES = ('frame', 'scan_update', 'update_rectangles', 'get_rectangles',
+              'get_tree_at_position', 'render_display', 'draw', 'render_text')
+HUD_WIDTH = 560
+# the directory that the profile of each phase is written to when the
+# visualiser is closed, or None to not profile the phases (see tm_stats)
+PROFILE_DIR = None
+
+# whether the treemap is laid out, drawn and hit-tested with the NumPy array
+# backend (see tm_arrays.ArrayLayout), which only supports slice-and-dice
+USE_ARRAYS = False
+
 # mapping of pygame key constants to the actions they correspond to.
 KEY_MAP = {pygame.K_m: 'm = move',
            pygame.K_UP: 'UP = increase size',
@@ -76,30 +113,114 @@ def get_screen_rect(screen: pygame.Surface,
             screen.get_height() - (FONT_HEIGHT + FONT_OFFSET) * font_rows)
 
 
-def run_visualisation(tree: TMTree, name: str) -> None:
+class TreemapCanvas:
+    """
+    An off-screen copy of the treemap drawn by render_display, which lets
+    later calls redraw only the parts of the screen that changed.
+
+    === Public Attributes ===
+    surface:
+        The treemap as it was last drawn, without any highlight rectangles,
+        or None if the treemap must be drawn again from scratch.
+    rect:
+        The rectangle of the screen that surface was drawn for.
+    text:
+        The text currently displayed below the treemap.
+    font_rows:
+        The number of rows used to display text.
+    highlights:
+        The areas of the screen covered by the highlight rectangles that are
+        currently drawn over the treemap.
+    """
+    surface: Optional[pygame.Surface]
+    rect: tuple[int, int, int, int]
+    text: str
+    font_rows: int
+    highlights: list[pygame.Rect]
+
+    def __init__(self) -> None:
+        """Initialize a new TreemapCanvas with nothing drawn yet."""
+        self.surface = None
+        self.rect = (0, 0, 0, 0)
+        self.text = ''
+        self.font_rows = FONT_ROWS
+        self.highlights = []
+
+    def invalidate(self) -> None:
+        """Record that the treemap must be drawn again from scratch, e.g.
+        because the tree was modified.
+        """
+        self.surface = None
+
+
+def run_visualisation(tree: TMTree, name: str,
+                      min_rect_size: int = MIN_RECT_SIZE,
+                      hud: bool = SHOW_HUD,
+                      profile_dir: Optional[str] = PROFILE_DIR,
+                      builder: Optional[DirectoryTreeBuilder] = None,
+                      arrays: bool = USE_ARRAYS) -> None:
     """
     Display an interactive graphical display of the treemap for <tree>.
 
     The title of the window is set to <name>.
+
+    If <builder> is given, <tree> is its tree, and the listings it reads in
+    the background are added to the treemap while it is displayed.
+
+    Trees narrower or shorter than <min_rect_size> pixels are displayed as a
+    single rectangle instead of by their subtrees (see TMTree.min_rect_size)
+    while the visualisation runs.
+
+    If <hud> is True, a HUD showing the time taken by each phase of the last
+    frame is drawn over the treemap. If <profile_dir> is not None, every
+    phase is profiled with cProfile and the memory it allocates is traced
+    with tracemalloc, and the reports are written to <profile_dir> when the
+    window is closed (see tm_stats.dump).
+
+    If <arrays> is True, the treemap is laid out, drawn and hit-tested with
+    the NumPy array backend instead of by the trees themselves (see
+    tm_arrays.ArrayLayout). This requires NumPy, and every tree in <tree> to
+    be laid out with slice-and-dice.
     """
+    # restored afterwards, so that trees displayed or laid out later in the
+    # same process are not affected
+    old_min_rect_size = TMTree.min_rect_size
+    TMTree.min_rect_size = min_rect_size
+    try:
+        if arrays:
+            # NumPy is only needed by the array backend
+            from tm_arrays import ArrayLayout
+            tree = ArrayLayout(tree)
+        if profile_dir is not None:
+            tm_stats.enable(True, True)
 
-    # Setup pygame
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+        # Setup pygame
+        pygame.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
 
-    pygame.display.set_caption(name)
+        pygame.display.set_caption(name)
 
-    # Render the initial display of the treemap.
-    tree.update_rectangles(get_screen_rect(screen, FONT_ROWS))
-    render_display(screen, tree, None, None)
+        # Render the initial display of the treemap.
+        canvas = TreemapCanvas()
+        tree.update_rectangles(get_screen_rect(screen, FONT_ROWS))
+        render_display(screen, tree, None, None, canvas)
 
-    # Start an event loop to respond to events.
-    event_loop(screen, tree, FONT_ROWS)
+        # Start an event loop to respond to events.
+        event_loop(screen, tree, FONT_ROWS, canvas, hud=hud, builder=builder)
 
+        if profile_dir is not None:
+            tm_stats.dump(profile_dir)
+            print(f"profiles written to {profile_dir}")
+            tm_stats.disable()
+    finally:
+        TMTree.min_rect_size = old_min_rect_size
 
+
+@tm_stats.timed('render_display')
 def render_display(screen: pygame.Surface, tree: Optional[TMTree],
                    selected_node: Optional[TMTree] = None,
-                   hover_node: Optional[TMTree] = None) -> int:
+                   hover_node: Optional[TMTree] = None,
+                   canvas: Optional[TreemapCanvas] = None) -> int:
     """
     Render a treemap and text information to the given <screen> for the given
     <tree>, and return the number of rows used to display the text of the
@@ -112,29 +233,50 @@ def render_display(screen: pygame.Surface, tree: Optional[TMTree],
     The <selected_node>, if not None, is highlighted in the visualization.
 
     The <hover_node>, if not None, is also highlighted in the visualization.
+
+    If a <canvas> is given and the treemap it holds is still up to date,
+    only the highlight rectangles and the text are redrawn, and only the
+    areas of the screen that changed are updated.
     """
+    text = _get_display_text(selected_node)
+    if canvas is not None and canvas.surface is not None \
+            and canvas.font_rows == _count_text_rows(screen, text) \
+            and tree.is_laid_out(get_screen_rect(screen, canvas.font_rows)):
+        _render_highlights(screen, canvas, text, selected_node, hover_node)
+        return canvas.font_rows
+
     # First, clear the screen
     pygame.draw.rect(screen, BLACK,
                      get_screen_rect(screen, FONT_ROWS, True))
 
     # Note: this should work after you have completed Task 2
     try:
-        font_rows = _render_text(screen, _get_display_text(selected_node))
+        font_rows = _render_text(screen, text)
+        # only the parts of the tree that changed since the last render are
+        # laid out again (see TMTree.update_rectangles)
         tree.update_rectangles(get_screen_rect(screen, font_rows))
 
         subscreen = screen.subsurface(get_screen_rect(screen, font_rows))
 
         # get the rectangles and draw them to the screen
-        for rect, colour in tree.get_rectangles():
-            pygame.draw.rect(subscreen, colour, rect)
+        with tm_stats.phase('draw'):
+            drawn = 0
+            for rect, colour in tree.iter_rectangles():
+                pygame.draw.rect(subscreen, colour, rect)
+                drawn += 1
+            tm_stats.count('draw', 'rects', drawn)
+
+        if canvas is not None:
+            canvas.surface = subscreen.copy()
+            canvas.rect = get_screen_rect(screen, font_rows)
+            canvas.text = text
+            canvas.font_rows = font_rows
+            canvas.highlights = []
 
         # add the selected and hover rectangles if necessary
-        if selected_node is not None:
-            pygame.draw.rect(subscreen, WHITE, selected_node.rect,
-                             SELECTED_HIGHLIGHT)
-        if hover_node is not None:
-            pygame.draw.rect(subscreen, WHITE, hover_node.rect,
-                             HOVER_HIGHLIGHT)
+        highlights = _draw_highlights(subscreen, selected_node, hover_node)
+        if canvas is not None:
+            canvas.highlights = highlights
 
     except Exception as e:
         print("Possibly an error in Task 2 code. See detailed error message.")
@@ -146,32 +288,131 @@ def render_display(screen: pygame.Surface, tree: Optional[TMTree],
     return font_rows
 
 
-def _render_text(screen: pygame.Surface, text: str) -> int:
+def _draw_highlights(surface: pygame.Surface,
+                     selected_node: Optional[TMTree],
+                     hover_node: Optional[TMTree]) -> list[pygame.Rect]:
     """
-    Render <text> at the bottom of the <screen>.
-    Return the number of rows needed to display the <text>.
+    Draw the highlight rectangles for <selected_node> and <hover_node> (if
+    they are not None) on <surface>, and return the areas they cover.
+    """
+    highlights = []
+    if selected_node is not None:
+        highlights.append(pygame.draw.rect(surface, WHITE, selected_node.rect,
+                                           SELECTED_HIGHLIGHT))
+    if hover_node is not None:
+        highlights.append(pygame.draw.rect(surface, WHITE, hover_node.rect,
+                                           HOVER_HIGHLIGHT))
+    return highlights
+
+
+def _render_highlights(screen: pygame.Surface, canvas: TreemapCanvas,
+                       text: str, selected_node: Optional[TMTree],
+                       hover_node: Optional[TMTree]) -> None:
     """
+    Replace the highlight rectangles and text on <screen> by those for
+    <selected_node>, <hover_node> and <text>, restoring the treemap under the
+    old highlights from <canvas>, and update only the areas that changed.
 
-    # The font we want to use
-    font = pygame.font.SysFont(FONT_FAMILY, FONT_HEIGHT - 2 * FONT_OFFSET)
+    Precondition:
+    <canvas> holds an up to date copy of the treemap on <screen>.
+    """
+    subscreen = screen.subsurface(canvas.rect)
+    dirty_rects = []
+    for area in canvas.highlights:
+        subscreen.blit(canvas.surface, area, area)
+        dirty_rects.append(area)
+
+    if text != canvas.text:
+        text_area = pygame.Rect(0, canvas.rect[3], screen.get_width(),
+                                screen.get_height() - canvas.rect[3])
+        pygame.draw.rect(screen, BLACK, text_area)
+        _render_text(screen, text)
+        canvas.text = text
+        dirty_rects.append(text_area)
+
+    canvas.highlights = _draw_highlights(subscreen, selected_node, hover_node)
+    dirty_rects.extend(canvas.highlights)
+    pygame.display.update(dirty_rects)
+
+
+def _count_text_rows(screen: pygame.Surface, text: str) -> int:
+    """
+    Return the number of rows needed to display <text> at the bottom of the
+    <screen>.
+    """
+    return len(_text_surfaces(text, screen.get_width()))
 
-    # fix this...
-    text_width, _ = font.size(text)  # _ since we ignore the text_height
-    height = int(1 + text_width / screen.get_width())
-    n_char = int(1 + len(text) / height)
 
-    font_rows = height
-    for h in range(height):
+@tm_stats.timed('render_text')
+def _render_text(screen: pygame.Surface, text: str) -> int:
+    """
+    Render <text> at the bottom of the <screen>.
+    Return the number of rows needed to display the <text>.
+    """
+    text_surfaces = _text_surfaces(text, screen.get_width())
+    font_rows = len(text_surfaces)
+    for h, text_surface in enumerate(text_surfaces):
         offset = (font_rows - h) * (FONT_HEIGHT + FONT_OFFSET/2)
         text_pos = (0, screen.get_height() - offset)
-        text_surface = font.render(text[h * n_char:(h + 1) * n_char],
-                                   ANTI_ALIAS,
-                                   WHITE)
         screen.blit(text_surface, text_pos)
     return font_rows
 
 
-def event_loop(screen: pygame.Surface, tree: TMTree, font_rows: int) -> None:
+@lru_cache(maxsize=None)
+def _get_font() -> pygame.font.Font:
+    """
+    Return the font used for the text display, which is only looked up the
+    first time it is needed.
+    """
+    return pygame.font.SysFont(FONT_FAMILY, FONT_HEIGHT - 2 * FONT_OFFSET)
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _text_surfaces(text: str, width: int) -> tuple[pygame.Surface, ...]:
+    """
+    Return the rendered rows of <text> when it is wrapped to fit a display
+    that is <width> pixels wide.
+
+    The most recently used results are cached, so text that is displayed
+    again is neither wrapped nor rendered again.
+    """
+    font = _get_font()
+    return tuple(font.render(line, ANTI_ALIAS, WHITE)
+                 for line in _wrap_text(font, text, width))
+
+
+def _wrap_text(font: pygame.font.Font, text: str, width: int) -> list[str]:
+    """
+    Return <text> split into lines that are at most <width> pixels wide when
+    rendered with <font>.
+
+    Lines are broken at spaces where possible, and a word that is too wide
+    for a line of its own is broken between characters.
+    """
+    lines = []
+    line = ''
+    for word in text.split(' '):
+        candidate = word if not line else line + ' ' + word
+        if font.size(candidate)[0] <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        while len(word) > 1 and font.size(word)[0] > width:
+            # the length of the longest prefix of word that fits, at least 1
+            n = bisect_left(range(2, len(word) + 1), True,
+                            key=lambda i: font.size(word[:i])[0] > width) + 1
+            lines.append(word[:n])
+            word = word[n:]
+        line = word
+    lines.append(line)
+    return lines
+
+
+def event_loop(screen: pygame.Surface, tree: TMTree, font_rows: int,
+               canvas: Optional[TreemapCanvas] = None,
+               max_fps: int = MAX_FPS, hud: bool = False,
+               builder: Optional[DirectoryTreeBuilder] = None) -> None:
     """Respond to events (mouse clicks, key presses) and update the <screen>.
 
     Note that the event loop is an *infinite loop*: it continually waits for
@@ -179,60 +420,177 @@ def event_loop(screen: pygame.Surface, tree: TMTree, font_rows: int) -> None:
     of the visualisation or the <tree> itself, updating the
     display if necessary.
 
+    The loop sleeps until there is an event, and then handles all of the
+    events that arrived since the last frame together, at most <max_fps>
+    times per second. A burst of mouse motion is handled as a single move to
+    the last position, and the hovered node is only looked up again when the
+    mouse moved or the tree changed.
+
     <font_rows> tells us how many rows of the display to use to show the
     text for the currently selected node.
 
+    <canvas> holds the treemap as it was last drawn, so that moving the mouse
+    or selecting a different node only redraws the highlights and the text.
+
+    If <hud> is True, the time each phase of the last frame took is drawn
+    over the top left corner of the treemap (see tm_stats). Pressing HUD_KEY
+    turns the HUD on and off. Unless tm_stats was already recording when the
+    loop started (e.g. for profiling), it only records while the HUD is
+    shown.
+
+    If <builder> is given, <tree> is its tree, and until its scan is done,
+    the listings it has read are added to <tree> every SCAN_UPDATE_INTERVAL
+    milliseconds (at most SCAN_BATCH_SIZE at a time), and the treemap is
+    redrawn, even if there are no events. If the scan fails, the error is
+    printed and the part of <tree> that was scanned stays displayed.
+
     This loop ends only when the user closes the window.
     """
     selected_node = None
     hover_node = None
+    if canvas is None:
+        canvas = TreemapCanvas()
+    clock = pygame.time.Clock()
+    next_update = 0
+    # whether the stats are recorded only for the HUD, so that recording
+    # them, which slows down every timed call, stops when the HUD is hidden
+    hud_stats = not tm_stats.enabled
+    if hud and hud_stats:
+        tm_stats.enable()
 
     while True:
-        # Wait for an event
-        event = pygame.event.poll()
-        if event.type == pygame.QUIT:
-            return
-
-        # handle resize event...
-        if event.type == pygame.WINDOWRESIZED:
-            print(f"window resized: {get_screen_rect(screen, font_rows)}")
-            # this should work once you have completed Task 2
-            tree.update_rectangles(get_screen_rect(screen, font_rows))
-
-        # get the hover position and the corresponding node
-        old_hover_node = hover_node
-        hover_node = tree.get_tree_at_position(pygame.mouse.get_pos())
-
-        if hover_node != old_hover_node:
-            # Update display
-            if hover_node:
-                print(f"hover node changed to {hover_node.get_path_string()}")
-            font_rows = render_display(screen, tree, selected_node, hover_node)
-
-        if event.type == pygame.MOUSEBUTTONUP:
-            selected_node = _handle_click(event.button, event.pos,
-                                          tree, selected_node)
-            # Update display
-            font_rows = render_display(screen, tree, selected_node, hover_node)
-
-        elif event.type == pygame.KEYUP and selected_node is not None:
-            if event.key in KEY_MAP:
-                print(f"[{KEY_MAP.get(event.key)}]")
-                sn = selected_node
-                selected_node = execute_task_4_expand_collapse_actions(event,
-                                                                       sn)
-                execute_task_4_other_actions(event, hover_node, selected_node)
-
-                execute_task_6_open_action(event, selected_node)
-            else:
-                print(f"Unrecognized key pressed, recognized keys are:")
-                for value in KEY_MAP.values():
-                    print(value)
-
-            # Update display
-            font_rows = render_display(screen, tree, selected_node, hover_node)
-        elif event.type == pygame.KEYUP and selected_node is None:
-            print(f"key pressed, but no node selected!")
+        # Sleep until an event arrives, then take every queued event
+        scanning = builder is not None and not builder.is_done()
+        events = _wait_for_events(SCAN_UPDATE_INTERVAL if scanning
+                                  else EVENT_WAIT_TIMEOUT)
+        with tm_stats.phase('frame'):
+            mouse_pos = None
+            changed = False
+            if scanning and pygame.time.get_ticks() >= next_update:
+                next_update = pygame.time.get_ticks() + SCAN_UPDATE_INTERVAL
+                with tm_stats.phase('scan_update'):
+                    try:
+                        updated = builder.update(SCAN_BATCH_SIZE)
+                    except OSError as error:
+                        # keep showing what was scanned before the error
+                        print(f"scan stopped: {error}")
+                        builder, updated = None, False
+                    if updated:
+                        # laid out now so that the hovered node is looked up
+                        # in the new rectangles
+                        tree.update_rectangles(get_screen_rect(screen,
+                                                               font_rows))
+                        canvas.invalidate()
+                        changed = True
+            for event in events:
+                if event.type == pygame.QUIT:
+                    return
+
+                # handle resize event...
+                if event.type == pygame.WINDOWRESIZED:
+                    screen_rect = get_screen_rect(screen, font_rows)
+                    print(f"window resized: {screen_rect}")
+                    # this should work once you have completed Task 2
+                    tree.update_rectangles(screen_rect)
+                    canvas.invalidate()
+                    changed = True
+                elif event.type == pygame.WINDOWEXPOSED:
+                    canvas.invalidate()
+                    changed = True
+
+                elif event.type == pygame.MOUSEMOTION:
+                    mouse_pos = event.pos
+
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    selected_node = _handle_click(event.button, event.pos,
+                                                  tree, selected_node)
+                    changed = True
+
+                elif event.type == pygame.KEYUP and event.key == HUD_KEY:
+                    hud = not hud
+                    if hud_stats and hud:
+                        tm_stats.enable()
+                    elif hud_stats:
+                        tm_stats.disable()
+                    canvas.invalidate()
+                    changed = True
+
+                elif event.type == pygame.KEYUP and selected_node is not None:
+                    if event.key in KEY_MAP:
+                        print(f"[{KEY_MAP.get(event.key)}]")
+                        sn = selected_node
+                        selected_node = \
+                            execute_task_4_expand_collapse_actions(event, sn)
+                        execute_task_4_other_actions(event, hover_node,
+                                                     selected_node)
+
+                        execute_task_6_open_action(event, selected_node)
+                        canvas.invalidate()
+                    else:
+                        print(f"Unrecognized key pressed, recognized keys "
+                              f"are:")
+                        for value in KEY_MAP.values():
+                            print(value)
+                    changed = True
+                elif event.type == pygame.KEYUP and selected_node is None:
+                    print(f"key pressed, but no node selected!")
+
+            if changed:
+                # laid out before the hovered node is looked up, since e.g.
+                # expanding a node may have added subtrees with no rect yet
+                tree.update_rectangles(get_screen_rect(screen, font_rows))
+
+            # get the hover position and the corresponding node, if the mouse
+            # moved or the rectangles may have changed
+            old_hover_node = hover_node
+            if changed or mouse_pos is not None:
+                if mouse_pos is None:
+                    mouse_pos = pygame.mouse.get_pos()
+                hover_node = tree.get_tree_at_position(mouse_pos)
+            if hover_node is not old_hover_node and hover_node:
+                print(f"hover node changed to "
+                      f"{hover_node.get_path_string()}")
+
+            rendered = changed or hover_node is not old_hover_node
+            if rendered:
+                # Update display
+                font_rows = render_display(screen, tree, selected_node,
+                                           hover_node, canvas)
+        frame = tm_stats.take_frame()
+        if hud and rendered:
+            _draw_hud(screen, frame)
+        clock.tick(max_fps)
+
+
+def _wait_for_events(timeout: int = EVENT_WAIT_TIMEOUT) \
+        -> list[pygame.event.Event]:
+    """
+    Return the events that are waiting to be handled, sleeping until there is
+    at least one (or until <timeout> milliseconds have passed, in which case
+    the list is empty).
+    """
+    event = pygame.event.wait(timeout)
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + pygame.event.get()
+
+
+def _draw_hud(screen: pygame.Surface,
+              frame: dict[str, tm_stats.PhaseStats]) -> None:
+    """
+    Draw the HUD for the phases recorded during a <frame> over the top left
+    corner of the <screen>, and update that area of the screen.
+    """
+    font = _get_font()
+    area = pygame.Rect(0, 0, HUD_WIDTH, len(HUD_PHASES) * FONT_HEIGHT)
+    area = area.clip(screen.get_rect())
+    pygame.draw.rect(screen, BLACK, area)
+    for i, name in enumerate(HUD_PHASES):
+        stats = frame.get(name, tm_stats.PhaseStats())
+        text_surface = font.render(f"{name}: {stats}", ANTI_ALIAS, WHITE)
+        screen.blit(text_surface, (FONT_OFFSET, i * FONT_HEIGHT),
+                    pygame.Rect(0, 0, area.width - FONT_OFFSET, FONT_HEIGHT))
+    pygame.display.update(area)
 
 
 def execute_task_6_open_action(event: pygame.event.Event,
@@ -343,9 +701,24 @@ def _get_display_text(leaf: Optional[TMTree]) -> str:
     return f'{leaf.get_path_string()} ({leaf.data_size})'
 
 
-def run_treemap_file_system(path: str) -> None:
+def run_treemap_file_system(path: str, lazy: bool = False,
+                            cache_path: Optional[str] = None,
+                            background: bool = False) -> None:
     """Run a treemap visualisation for the given path's file structure.
 
+    If <background> is True, the visualisation starts right away with an
+    empty treemap, and <path> is scanned on a background thread, with each
+    directory added to the treemap as soon as it is listed (see
+    DirectoryTreeBuilder). <lazy> and <cache_path> are ignored.
+
+    If <lazy> is True, only the top level of <path> is read before the
+    visualisation starts, and each directory is read when it is expanded.
+    The sizes of directories that have not been read yet are estimated,
+    unless a <cache_path> is given.
+
+    If <cache_path> is given, the scan is recorded in the ScanCache database
+    at that path, and later runs only list the directories that changed.
+
     Precondition: <path> is a valid path to a directory.
 
     If the provided <path> violates this precondition, this code will raise
@@ -354,23 +727,58 @@ def run_treemap_file_system(path: str) -> None:
     if not os.path.isdir(path):
         raise ValueError(f"{path} is not a path to a valid directory!")
 
-    file_tree_tuple = path_to_nested_tuple(path)
-    file_tree = dir_tree_from_nested_tuple(file_tree_tuple)
+    if background:
+        builder = DirectoryTreeBuilder(path)
+        try:
+            run_visualisation(builder.tree, "file system visualizer",
+                              builder=builder)
+        finally:
+            builder.cancel()
+        return
+
+    cache = None if cache_path is None else ScanCache(cache_path)
+    if lazy:
+        sizes = None if cache is None else cache.directory_sizes(path)
+        file_tree = lazy_dir_tree_from_path(path, sizes)
+    elif cache is not None:
+        file_tree = dir_tree_from_nested_tuple(cache.scan_nested_tuple(path))
+    else:
+        file_tree_tuple = path_to_nested_tuple(path)
+        file_tree = dir_tree_from_nested_tuple(file_tree_tuple)
+    if cache is not None:
+        cache.save()
     run_visualisation(file_tree, "file system visualizer")
 
 
+def run_treemap_snapshot(path: str, restore_expanded: bool = False) -> None:
+    """Run a treemap visualisation for the tree saved in the snapshot file
+    at <path> (see tm_snapshot.save_snapshot).
+
+    Only the trees that are displayed are read from the snapshot, so even a
+    large tree is displayed right away. If <restore_expanded> is True, the
+    trees that were expanded when the snapshot was saved are expanded again.
+    """
+    tree = load_snapshot(path, restore_expanded)
+    run_visualisation(tree, "snapshot visualizer")
+
+
 # the names of the three chess data sets
 CHESS_DATA_SETS = [f"wgm_{num_games}.json" for num_games in [10, 200, 999]]
 
 
-def run_treemap_chess() -> None:
-    """Run a treemap visualization for chess games.
+def run_treemap_chess(path: str = CHESS_DATA_SETS[2],
+                      max_depth: Optional[int] = None,
+                      min_games: int = 1, max_workers: int = 1) -> None:
+    """Run a treemap visualization for the chess games in the file at <path>.
+
+    The games are read one at a time (see tm_chess.read_games), so <path> can
+    be a JSON array of games or a file with one game per line. Moves more than
+    <max_depth> deep and moves played in fewer than <min_games> games are
+    grouped together while the games are read. A file with one game per line
+    is split between <max_workers> processes (see chess_tree_from_file).
     """
     # you can choose which data set to load or make your own!
-    with open(CHESS_DATA_SETS[2]) as file:
-        chess_moves = json.load(file)
-    chess_dict = moves_to_nested_dict(chess_moves)
-    chess_tree = ChessTree(chess_dict)
+    chess_tree = chess_tree_from_file(path, max_depth, min_games, max_workers)
     run_visualisation(chess_tree, "chess tree visualizer")
 
 